@@ -8,7 +8,28 @@ import os
 import sys
 import json
 import gzip
-from github import Github, Auth
+import shutil
+import hashlib
+import requests
+from collections import deque
+
+# orjson is optional: it parses/serializes large flows several times
+# faster, but the stdlib codec is used when it isn't installed
+try:
+    import orjson
+    
+    def load_json(f):
+        return orjson.loads(f.read())
+    
+    def dump_json(obj):
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2)
+except ImportError:
+    def load_json(f):
+        return json.load(f)
+    
+    def dump_json(obj):
+        return json.dumps(obj, indent=2).encode('utf-8')
+
 
 GITHUB_TOKEN = os.environ.get('GITHUB_TOKEN')
 GITHUB_REPO = os.environ.get('GITHUB_REPO')
@@ -16,35 +37,126 @@ BACKUP_BRANCH = os.environ.get('BACKUP_BRANCH', 'main')
 BACKUP_DATE = os.environ.get('BACKUP_DATE', '2026-01-27')
 BACKUP_TIME = os.environ.get('BACKUP_TIME', '00-01-UTC')
 BACKUP_FOLDER = os.environ.get('BACKUP_FOLDER', 'nifi-backups')
+GITHUB_API_URL = os.environ.get('GITHUB_API_URL', 'https://api.github.com')
+# Private backup flows are cached per user, not in the shared /tmp
+GITHUB_CACHE_DIR = os.environ.get('GITHUB_CACHE_DIR', os.path.expanduser('~/.cache/nifi-backup/inspect'))
+DUMP_STRUCTURE = os.environ.get('DUMP_STRUCTURE') == '1'
+
+DOWNLOAD_CHUNK_SIZE = 65536
+GZIP_MAGIC = b'\x1f\x8b'
+
+
+def fetch_backup_file(file_path):
+    """
+    Download a file from the backup branch into the local cache and
+    return the cached file path.
+    Sends the ETag of the cached copy (if any) as If-None-Match, so an
+    unchanged backup comes back as a 304 with no body and does not count
+    against the API rate limit.
+    """
+    cache_key = hashlib.sha256(f"{GITHUB_REPO}@{BACKUP_BRANCH}:{file_path}".encode()).hexdigest()
+    content_file = os.path.join(GITHUB_CACHE_DIR, cache_key)
+    etag_file = f"{content_file}.etag"
+    
+    url = f"{GITHUB_API_URL}/repos/{GITHUB_REPO}/contents/{file_path}"
+    headers = {
+        'Authorization': f'token {GITHUB_TOKEN}',
+        'Accept': 'application/vnd.github.raw',
+        'Accept-Encoding': 'gzip'
+    }
+    if os.path.exists(content_file) and os.path.exists(etag_file):
+        with open(etag_file, 'r') as f:
+            headers['If-None-Match'] = f.read().strip()
+    
+    with requests.get(url, headers=headers, params={'ref': BACKUP_BRANCH},
+                      timeout=120, stream=True) as response:
+        if response.status_code == 304:
+            print("♻️  Backup unchanged since last run, using cached copy")
+            return content_file
+        response.raise_for_status()
+        
+        # Stream to disk; decode_content undoes any transport-level gzip
+        response.raw.decode_content = True
+        os.makedirs(GITHUB_CACHE_DIR, mode=0o700, exist_ok=True)
+        with open(f"{content_file}.part", 'wb') as f:
+            shutil.copyfileobj(response.raw, f, DOWNLOAD_CHUNK_SIZE)
+        os.replace(f"{content_file}.part", content_file)
+        
+        etag = response.headers.get('ETag')
+        if etag:
+            with open(etag_file, 'w') as f:
+                f.write(etag)
+        elif os.path.exists(etag_file):
+            os.remove(etag_file)
+    
+    return content_file
+
+
+def open_flow_file(file_path):
+    """Open a backup flow file for reading, decompressing it if gzipped"""
+    with open(file_path, 'rb') as f:
+        magic = f.read(2)
+    if magic == GZIP_MAGIC:
+        return gzip.open(file_path, 'rb')
+    return open(file_path, 'rb')
 
 
 def print_structure(obj, indent=0, max_depth=10, current_depth=0):
-    """Recursively print object structure"""
-    if current_depth > max_depth:
-        print("  " * indent + "... (max depth reached)")
-        return
+    """Print object structure (iterative depth-first walk, single write)"""
+    # Stack entries are (obj, indent, depth); a str obj is a line ready to print.
+    # Children are pushed in reverse so output order matches a recursive walk.
+    stack = deque([(obj, indent, current_depth)])
+    lines = []
+    seen = set()
     
-    if isinstance(obj, dict):
-        for key, value in obj.items():
-            if isinstance(value, (dict, list)):
-                if isinstance(value, list):
-                    print("  " * indent + f"📋 {key}: [{len(value)} items]")
+    while stack:
+        obj, indent, current_depth = stack.pop()
+        obj_type = type(obj)
+        
+        if obj_type is str:
+            lines.append(obj)
+            continue
+        
+        prefix = "  " * indent
+        if current_depth > max_depth:
+            lines.append(prefix + "... (max depth reached)")
+            continue
+        
+        # Shared sub-objects are only expanded the first time
+        obj_id = id(obj)
+        if obj_id in seen:
+            lines.append(prefix + "(already shown)")
+            continue
+        seen.add(obj_id)
+        
+        pending = []
+        if obj_type is dict:
+            for key, value in obj.items():
+                value_type = type(value)
+                if value_type is list:
+                    pending.append((prefix + f"📋 {key}: [{len(value)} items]", 0, 0))
                     if len(value) > 0:
-                        print("  " * indent + f"   First item type: {type(value[0]).__name__}")
-                        if isinstance(value[0], dict):
-                            print_structure(value[0], indent + 2, max_depth, current_depth + 1)
+                        pending.append((prefix + f"   First item type: {type(value[0]).__name__}", 0, 0))
+                        if type(value[0]) is dict:
+                            pending.append((value[0], indent + 2, current_depth + 1))
+                elif value_type is dict:
+                    pending.append((prefix + f"📁 {key}:", 0, 0))
+                    pending.append((value, indent + 1, current_depth + 1))
                 else:
-                    print("  " * indent + f"📁 {key}:")
-                    print_structure(value, indent + 1, max_depth, current_depth + 1)
-            else:
-                value_str = str(value)
-                if len(value_str) > 50:
-                    value_str = value_str[:50] + "..."
-                print("  " * indent + f"📄 {key}: {value_str}")
-    elif isinstance(obj, list):
-        print("  " * indent + f"List with {len(obj)} items")
-        if len(obj) > 0 and isinstance(obj[0], dict):
-            print_structure(obj[0], indent, max_depth, current_depth + 1)
+                    value_str = str(value)
+                    if len(value_str) > 50:
+                        value_str = value_str[:50] + "..."
+                    pending.append((prefix + f"📄 {key}: {value_str}", 0, 0))
+        elif obj_type is list:
+            pending.append((prefix + f"List with {len(obj)} items", 0, 0))
+            if len(obj) > 0 and type(obj[0]) is dict:
+                pending.append((obj[0], indent, current_depth + 1))
+        
+        stack.extend(reversed(pending))
+    
+    # Emit the whole dump with one write instead of one print per node
+    if lines:
+        sys.stdout.write('\n'.join(lines) + '\n')
 
 
 def main():
@@ -64,23 +176,13 @@ def main():
         print(f"🕐 Backup Time: {BACKUP_TIME}")
         print("")
         
-        auth = Auth.Token(GITHUB_TOKEN)
-        g = Github(auth=auth)
-        repo = g.get_repo(GITHUB_REPO)
-        
         # Download backup
         backup_path = f"{BACKUP_FOLDER}/{BACKUP_DATE}/{BACKUP_TIME}"
-        flow_file = repo.get_contents(f"{backup_path}/flow.json.gz", ref=BACKUP_BRANCH)
-        flow_content = flow_file.decoded_content
-        
-        # Try to decompress
-        try:
-            flow_json = gzip.decompress(flow_content)
-        except:
-            flow_json = flow_content
+        flow_path = fetch_backup_file(f"{backup_path}/flow.json.gz")
         
-        # Parse JSON
-        flow_data = json.loads(flow_json)
+        # Decompress and parse in one streaming pass
+        with open_flow_file(flow_path) as f:
+            flow_data = load_json(f)
         
         print("=" * 60)
         print("BACKUP STRUCTURE")
@@ -140,14 +242,13 @@ def main():
             
             print("")
         
-        # Save full structure to file
-        output_file = "/tmp/backup-structure.json"
-        with open(output_file, 'w') as f:
-            json.dump(flow_data, f, indent=2)
-        print(f"💾 Full backup saved to: {output_file}")
-        print("")
-        
-        g.close()
+        # Save full structure to file (opt-in, gzipped)
+        if DUMP_STRUCTURE:
+            output_file = "/tmp/backup-structure.json.gz"
+            with gzip.open(output_file, 'wb') as f:
+                f.write(dump_json(flow_data))
+            print(f"💾 Full backup saved to: {output_file}")
+            print("")
         
     except Exception as e:
         print(f"❌ Error: {e}")
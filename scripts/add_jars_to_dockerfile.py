@@ -4,10 +4,37 @@ Script to dynamically add ONLY NEW JARs to Dockerfile during build time.
 Compares JAR manifests with existing Dockerfile entries and only adds missing JARs.
 """
 
+import io
 import os
 import re
+import sys
 import json
+import hashlib
+import http.client
+import urllib.error
+import urllib.request
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+# orjson is optional: parses manifest bytes directly and faster,
+# stdlib json (which also accepts bytes) is used when it isn't installed
+try:
+    from orjson import loads as json_loads
+except ImportError:
+    from json import loads as json_loads
+
+
+# Pattern to match curl commands downloading JARs
+# Matches: RUN curl -L "url" \
+#              -o /path/to/jar.jar
+# Only follows backslash line continuations, so a match never spills
+# into the next RUN instruction.
+CURL_JAR_PATTERN = re.compile(
+    r'curl\s+-L\s+"([^"]+)"(?:[^\n]*\\\n)*?[^\n]*?-o\s+([^\s\\]+\.jar)'
+)
+
+# Install location used when a manifest doesn't set install_path
+DEFAULT_INSTALL_PATH = '/opt/nifi/nifi-current/lib/'
 
 
 def parse_dockerfile_jars(dockerfile_path):
@@ -15,22 +42,36 @@ def parse_dockerfile_jars(dockerfile_path):
     Parse existing JAR downloads from Dockerfile.
     Returns set of JAR names already in Dockerfile.
     """
-    existing_jars = set()
-    
     with open(dockerfile_path, 'r') as f:
         content = f.read()
     
-    # Pattern to match curl commands downloading JARs
-    # Matches: RUN curl -L "url" -o /path/to/jar.jar
-    pattern = r'curl\s+-L\s+"([^"]+)"\s+.*?-o\s+([^\s\\]+\.jar)'
+    existing_jars = {
+        match.group(2).rpartition('/')[2]
+        for match in CURL_JAR_PATTERN.finditer(content)
+    }
     
-    matches = re.findall(pattern, content, re.MULTILINE | re.DOTALL)
+    return existing_jars
+
+
+def load_manifest(manifest_file):
+    """Load one manifest file. Returns (jar_name, jar_info) or None"""
+    try:
+        with open(manifest_file, 'rb') as f:
+            manifest = json_loads(f.read())
+    except json.JSONDecodeError as e:
+        print(f"Error parsing {manifest_file}: {e}")
+        return None
     
-    for url, jar_path in matches:
-        jar_name = os.path.basename(jar_path)
-        existing_jars.add(jar_name)
+    get = manifest.get
+    jar_name = get('name')
+    if not jar_name:
+        return None
     
-    return existing_jars
+    return jar_name, {
+        'url': get('url'),
+        'install_path': get('install_path', DEFAULT_INSTALL_PATH),
+        'description': get('description', '')
+    }
 
 
 def scan_jars_folder(jars_folder):
@@ -42,20 +83,15 @@ def scan_jars_folder(jars_folder):
         print(f"JARs folder not found: {jars_folder}")
         return requested_jars
     
-    for manifest_file in jars_path.glob("*.json"):
-        try:
-            with open(manifest_file, 'r') as f:
-                manifest = json.load(f)
-            
-            jar_name = manifest.get('name')
-            if jar_name:
-                requested_jars[jar_name] = {
-                    'url': manifest.get('url'),
-                    'install_path': manifest.get('install_path', '/opt/nifi/nifi-current/lib/'),
-                    'description': manifest.get('description', '')
-                }
-        except json.JSONDecodeError as e:
-            print(f"Error parsing {manifest_file}: {e}")
+    # Manifests are independent, so overlap the file reads
+    manifest_files = list(jars_path.glob("*.json"))
+    with ThreadPoolExecutor(max_workers=min(32, len(manifest_files) or 1)) as executor:
+        results = executor.map(load_manifest, manifest_files)
+    
+    for result in results:
+        if result:
+            jar_name, jar_info = result
+            requested_jars[jar_name] = jar_info
     
     return requested_jars
 
@@ -65,16 +101,63 @@ def find_new_jars(existing_jars, requested_jars):
     Compare existing JARs in Dockerfile with requested JARs.
     Returns dict of NEW JARs that need to be added.
     """
-    new_jars = {}
+    # Set algebra on the dict keys view; sorted so the order of the
+    # generated Dockerfile lines doesn't depend on set/glob ordering
+    new_names = sorted(requested_jars.keys() - existing_jars)
+    existing_names = sorted(requested_jars.keys() & existing_jars)
+    
+    for jar_name in existing_names:
+        print(f"  ✓ EXISTING: {jar_name}")
+    for jar_name in new_names:
+        print(f"  ✨ NEW: {jar_name}")
+    
+    return {jar_name: requested_jars[jar_name] for jar_name in new_names}
+
+
+class HeadRedirectHandler(urllib.request.HTTPRedirectHandler):
+    """Follow redirects without turning HEAD requests into GETs"""
+    
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        new_req = super().redirect_request(req, fp, code, msg, headers, newurl)
+        if new_req is not None:
+            new_req.method = req.get_method()
+        return new_req
+
+
+URL_OPENER = urllib.request.build_opener(HeadRedirectHandler)
+
+
+def check_jar_url(url):
+    """HEAD a JAR download URL. Returns the HTTP status code or an error message"""
+    if not url:
+        return "no url in manifest"
     
-    for jar_name, jar_info in requested_jars.items():
-        if jar_name not in existing_jars:
-            new_jars[jar_name] = jar_info
-            print(f"  ✨ NEW: {jar_name}")
-        else:
-            print(f"  ✓ EXISTING: {jar_name}")
+    try:
+        request = urllib.request.Request(url, method='HEAD')
+        with URL_OPENER.open(request, timeout=10) as response:
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+    except (OSError, ValueError, http.client.InvalidURL) as e:
+        # ValueError/InvalidURL: malformed manifest URL, reported like any
+        # other unreachable one instead of aborting the build
+        return str(e)
+
+
+def find_invalid_urls(jars_dict):
+    """
+    Check all JAR download URLs concurrently.
+    Returns dict of jar_name -> status/error for URLs that are not reachable.
+    """
+    jar_names = list(jars_dict)
+    with ThreadPoolExecutor(max_workers=min(32, len(jar_names) or 1)) as executor:
+        results = executor.map(check_jar_url, (jars_dict[name]['url'] for name in jar_names))
     
-    return new_jars
+    return {
+        jar_name: result
+        for jar_name, result in zip(jar_names, results)
+        if not (isinstance(result, int) and result < 400)
+    }
 
 
 def generate_dockerfile_additions(jars_dict):
@@ -82,31 +165,81 @@ def generate_dockerfile_additions(jars_dict):
     if not jars_dict:
         return ""
     
-    additions = []
+    # Write straight into one buffer instead of formatting and joining
+    # a string per JAR
+    buf = io.StringIO()
     
-    for jar_name, jar_info in jars_dict.items():
+    for index, (jar_name, jar_info) in enumerate(jars_dict.items()):
         url = jar_info['url']
         install_path = jar_info['install_path'].rstrip('/')
         description = jar_info.get('description', jar_name)
         full_path = f"{install_path}/{jar_name}"
         
-        addition = f"""
-# Download {description}
-RUN curl -L "{url}" \\
-        -o {full_path} && \\
-        chown 1000:1000 {full_path}
-"""
-        additions.append(addition)
+        if index:
+            buf.write('\n')
+        buf.write('\n# Download ')
+        buf.write(description)
+        buf.write('\nRUN curl -L "')
+        buf.write(url)
+        buf.write('" \\\n        -o ')
+        buf.write(full_path)
+        buf.write(' && \\\n        chown 1000:1000 ')
+        buf.write(full_path)
+        buf.write('\n')
+    
+    return buf.getvalue()
+
+
+def get_input_state(dockerfile_path, jars_folder):
+    """Fingerprint the inputs: Dockerfile content hash + manifest mtimes"""
+    with open(dockerfile_path, 'rb') as f:
+        dockerfile_sha = hashlib.sha256(f.read()).hexdigest()
     
-    return '\n'.join(additions)
+    return {
+        'dockerfile_sha256': dockerfile_sha,
+        'manifest_mtimes': {
+            str(p): p.stat().st_mtime_ns for p in Path(jars_folder).glob("*.json")
+        }
+    }
 
 
-def update_dockerfile(dockerfile_path, jars_folder):
+def load_state(state_file, dockerfile_path):
+    """Load the last recorded input state for this Dockerfile, if any"""
+    try:
+        with open(state_file, 'r') as f:
+            return json.load(f).get(os.path.abspath(dockerfile_path))
+    except (OSError, ValueError):
+        return None
+
+
+def save_state(state_file, dockerfile_path, state):
+    """Record the input state for this Dockerfile"""
+    try:
+        with open(state_file, 'r') as f:
+            all_states = json.load(f)
+    except (OSError, ValueError):
+        all_states = {}
+    
+    all_states[os.path.abspath(dockerfile_path)] = state
+    os.makedirs(os.path.dirname(state_file), exist_ok=True)
+    with open(state_file, 'w') as f:
+        json.dump(all_states, f, indent=2)
+
+
+def update_dockerfile(dockerfile_path, jars_folder, fail_on_invalid_url=False, state_file=None):
     """Update Dockerfile with ONLY NEW JAR download commands"""
     print(f"\n{'='*60}")
     print("Scanning for NEW JARs to add to Dockerfile")
     print(f"{'='*60}\n")
     
+    # Skip everything if neither the Dockerfile nor any manifest changed
+    # since the last run (keeps the Dockerfile mtime untouched)
+    if state_file:
+        input_state = get_input_state(dockerfile_path, jars_folder)
+        if load_state(state_file, dockerfile_path) == input_state:
+            print("✅ Dockerfile and JAR manifests unchanged since last run - up to date")
+            return
+    
     # Parse existing JARs from Dockerfile
     existing_jars = parse_dockerfile_jars(dockerfile_path)
     print(f"Found {len(existing_jars)} existing JARs in Dockerfile:")
@@ -126,6 +259,8 @@ def update_dockerfile(dockerfile_path, jars_folder):
         print(f"\n{'='*60}")
         print("✅ No new JARs to add - Dockerfile is up to date")
         print(f"{'='*60}\n")
+        if state_file:
+            save_state(state_file, dockerfile_path, input_state)
         return
     
     print(f"\n{'='*60}")
@@ -134,6 +269,19 @@ def update_dockerfile(dockerfile_path, jars_folder):
         print(f"  ✨ {jar_name}")
     print(f"{'='*60}\n")
     
+    # Validate download URLs before they are baked into the Dockerfile
+    print("Validating JAR download URLs...")
+    invalid_urls = find_invalid_urls(new_jars)
+    if invalid_urls:
+        for jar_name, problem in invalid_urls.items():
+            print(f"  ⚠️  {jar_name}: {new_jars[jar_name]['url']} ({problem})")
+        if fail_on_invalid_url:
+            print(f"\n❌ {len(invalid_urls)} JAR URL(s) are not reachable - aborting")
+            sys.exit(1)
+    else:
+        print(f"  ✅ All {len(new_jars)} URL(s) reachable")
+    print("")
+    
     # Read current Dockerfile
     with open(dockerfile_path, 'r') as f:
         content = f.read()
@@ -148,11 +296,10 @@ def update_dockerfile(dockerfile_path, jars_folder):
         content = content.replace(marker, f"{additions}\n{marker}")
         print(f"✅ Inserted {len(new_jars)} new JAR(s) before marker comment")
     elif 'USER 1000' in content:
-        # Insert before USER 1000
-        lines = content.split('\n')
-        insert_index = next((i for i, line in enumerate(lines) if 'USER 1000' in line), len(lines))
-        lines.insert(insert_index, additions)
-        content = '\n'.join(lines)
+        # Insert before the line containing USER 1000
+        user_index = content.find('USER 1000')
+        line_start = content.rfind('\n', 0, user_index) + 1
+        content = content[:line_start] + additions + '\n' + content[line_start:]
         print(f"✅ Inserted {len(new_jars)} new JAR(s) before USER 1000")
     else:
         # Append at the end
@@ -163,6 +310,9 @@ def update_dockerfile(dockerfile_path, jars_folder):
     with open(dockerfile_path, 'w') as f:
         f.write(content)
     
+    if state_file:
+        save_state(state_file, dockerfile_path, get_input_state(dockerfile_path, jars_folder))
+    
     print(f"\n{'='*60}")
     print(f"✅ Successfully updated Dockerfile with {len(new_jars)} new JAR(s)")
     print(f"{'='*60}\n")
@@ -172,5 +322,10 @@ if __name__ == '__main__':
     # Get paths from environment or use defaults
     dockerfile_path = os.environ.get('DOCKERFILE_PATH', 'Dockerfile')
     jars_folder = os.environ.get('JARS_FOLDER', 'jars')
+    fail_on_invalid_url = os.environ.get('FAIL_ON_INVALID_URL', 'false').lower() == 'true'
+    state_file = os.environ.get(
+        'JAR_STATE_FILE',
+        os.path.expanduser('~/.cache/jar-automation/state.json')
+    )
     
-    update_dockerfile(dockerfile_path, jars_folder)
\ No newline at end of file
+    update_dockerfile(dockerfile_path, jars_folder, fail_on_invalid_url, state_file)
\ No newline at end of file
@@ -8,14 +8,47 @@ import os
 import sys
 import json
 import gzip
+import base64
+import tempfile
 import requests
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from datetime import datetime
-from github import Github, Auth
+
+# orjson is optional: it parses multi-MB flows several times faster, but
+# the stdlib codec is used when it isn't installed
+try:
+    import orjson
+    
+    def load_json(f):
+        return orjson.loads(f.read())
+    
+    def dump_json(obj):
+        return orjson.dumps(obj)
+except ImportError:
+    def load_json(f):
+        return json.load(f)
+    
+    def dump_json(obj):
+        return json.dumps(obj, separators=(',', ':')).encode('utf-8')
 
 # Disable SSL warnings
 import urllib3
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
+# Shared NiFi session: reuses the TLS connection across API calls and
+# retries transient gateway errors
+NIFI_SESSION = requests.Session()
+NIFI_SESSION.verify = False
+NIFI_SESSION.mount('https://', HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=4,
+    max_retries=Retry(total=3, backoff_factor=0.5, status_forcelist=[502, 503, 504])
+))
+
 # Configuration
 NIFI_HOST = os.environ.get('NIFI_HOST')
 NIFI_USERNAME = os.environ.get('NIFI_USERNAME')
@@ -24,41 +57,178 @@ GITHUB_TOKEN = os.environ.get('GITHUB_TOKEN')
 GITHUB_REPO = os.environ.get('GITHUB_REPO')
 BACKUP_BRANCH = os.environ.get('BACKUP_BRANCH', 'main')
 BACKUP_FOLDER = os.environ.get('BACKUP_FOLDER', 'nifi-backups')
+GITHUB_API_URL = os.environ.get('GITHUB_API_URL', 'https://api.github.com')
+# Skip parsing the flow for statistics (upload-only runs)
+SKIP_STATS = os.environ.get('SKIP_STATS', 'false').lower() in ('true', '1')
+# Last backed-up flow ETag, used to skip unchanged flows
+BACKUP_STATE_FILE = os.environ.get('BACKUP_STATE_FILE', os.path.expanduser('~/.nifi-backup-state.json'))
+
+# Shared GitHub REST session: the few Git Data API calls used here are made
+# directly instead of through PyGithub's object wrappers
+GITHUB_SESSION = requests.Session()
+GITHUB_SESSION.headers.update({
+    'Authorization': f'token {GITHUB_TOKEN}',
+    'Accept': 'application/vnd.github+json'
+})
+
+# Streaming settings
+DOWNLOAD_CHUNK_SIZE = 65536
+BASE64_CHUNK_SIZE = 49152  # Multiple of 3 so encoded chunks concatenate cleanly
+GZIP_MAGIC = b'\x1f\x8b'
+
+# (flow key, stats key) pairs counted for every process group
+COMPONENT_COUNT_KEYS = (
+    ('processors', 'processors'),
+    ('connections', 'connections'),
+    ('inputPorts', 'input_ports'),
+    ('outputPorts', 'output_ports'),
+    ('funnels', 'funnels'),
+    ('labels', 'labels')
+)
 
 
 def get_nifi_token():
-    """Authenticate with NiFi"""
+    """Authenticate with NiFi and attach the token to the shared session"""
     url = f"{NIFI_HOST}/nifi-api/access/token"
-    response = requests.post(
+    response = NIFI_SESSION.post(
         url,
         data={'username': NIFI_USERNAME, 'password': NIFI_PASSWORD},
-        verify=False,
         timeout=30
     )
     response.raise_for_status()
-    return response.text
+    token = response.text
+    NIFI_SESSION.headers['Authorization'] = f'Bearer {token}'
+    return token
 
 
-def get_root_process_group_id(token):
+def get_root_process_group_id():
     """Get root process group ID"""
     url = f"{NIFI_HOST}/nifi-api/flow/process-groups/root"
-    headers = {'Authorization': f'Bearer {token}'}
-    response = requests.get(url, headers=headers, verify=False, timeout=30)
+    response = NIFI_SESSION.get(url, timeout=30)
     response.raise_for_status()
     return response.json()['processGroupFlow']['id']
 
 
-def download_flow(token, process_group_id):
-    """Download flow from NiFi"""
+def load_backup_state():
+    """Load the state saved by the last successful backup of NIFI_HOST"""
+    try:
+        with open(BACKUP_STATE_FILE, 'rb') as f:
+            state = load_json(f)
+    except (OSError, ValueError):
+        return {}
+    return state if state.get('host') == NIFI_HOST else {}
+
+
+def save_backup_state(state):
+    """Persist backup state (flow ETag, flow blob SHA, statistics) for the next run"""
+    try:
+        with open(BACKUP_STATE_FILE, 'wb') as f:
+            f.write(dump_json({'host': NIFI_HOST, **state}))
+    except OSError as e:
+        print(f"  ⚠️  Could not save backup state: {e}")
+
+
+def download_flow(process_group_id, etag=None):
+    """
+    Stream flow from NiFi into a gzipped temp file.
+    If NiFi gzips the response on the wire, those bytes are stored as-is
+    (no decompress + recompress round trip); plain JSON is compressed on
+    the fly as chunks arrive.
+    Returns (path, etag); path is None when NiFi answers 304 Not Modified
+    to the If-None-Match etag.
+    """
     url = f"{NIFI_HOST}/nifi-api/process-groups/{process_group_id}/download"
-    headers = {'Authorization': f'Bearer {token}'}
-    response = requests.get(url, headers=headers, verify=False, timeout=120)
+    headers = {'Accept-Encoding': 'gzip'}
+    if etag:
+        headers['If-None-Match'] = etag
+    with NIFI_SESSION.get(url, headers=headers, timeout=120, stream=True) as response:
+        if response.status_code == 304:
+            return None, etag
+        response.raise_for_status()
+        etag = response.headers.get('ETag')
+        if response.headers.get('Content-Encoding', '').lower() == 'gzip':
+            chunks = response.raw.stream(DOWNLOAD_CHUNK_SIZE, decode_content=False)
+        else:
+            chunks = response.iter_content(DOWNLOAD_CHUNK_SIZE)
+        first_chunk = next(chunks, b'')
+        
+        with tempfile.NamedTemporaryFile(suffix='.json.gz', delete=False) as f:
+            if first_chunk[:2] == GZIP_MAGIC:
+                writer = nullcontext(f)
+            else:
+                writer = gzip.GzipFile(fileobj=f, mode='wb', compresslevel=6)
+            with writer as out:
+                out.write(first_chunk)
+                for chunk in chunks:
+                    out.write(chunk)
+    return f.name, etag
+
+
+def github_api(method, path, **kwargs):
+    """Call a GitHub REST endpoint under /repos/GITHUB_REPO and return the JSON body"""
+    url = f"{GITHUB_API_URL}/repos/{GITHUB_REPO}{path}"
+    response = GITHUB_SESSION.request(method, url, timeout=kwargs.pop('timeout', 60), **kwargs)
     response.raise_for_status()
-    return response.content
+    return response.json()
+
+
+def create_blob_from_file(file_path):
+    """
+    Create a Git blob from a local file via the Git Data API.
+    The base64 request body is built on disk and streamed, so memory use
+    stays constant regardless of the file size.
+    """
+    with tempfile.TemporaryFile() as body:
+        body.write(b'{"encoding": "base64", "content": "')
+        with open(file_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(BASE64_CHUNK_SIZE), b''):
+                body.write(base64.b64encode(chunk))
+        body.write(b'"}')
+        body.seek(0)
+        blob = github_api(
+            'POST', '/git/blobs',
+            data=body,
+            headers={'Content-Type': 'application/json'},
+            timeout=300
+        )
+    return blob['sha']
+
 
+def create_blob(content):
+    """Create a Git blob from in-memory bytes and return its SHA"""
+    blob = github_api('POST', '/git/blobs', json={
+        'encoding': 'base64',
+        'content': base64.b64encode(content).decode('ascii')
+    })
+    return blob['sha']
 
-def count_components_recursive(flow_contents):
-    """Recursively count all components including nested ones"""
+
+def commit_blobs(blobs, message):
+    """
+    Commit several blobs to BACKUP_BRANCH in a single commit.
+    blobs maps repository path -> blob SHA; existing files are replaced.
+    """
+    ref = github_api('GET', f"/git/ref/heads/{BACKUP_BRANCH}")
+    parent_sha = ref['object']['sha']
+    parent = github_api('GET', f"/git/commits/{parent_sha}")
+    tree = github_api('POST', '/git/trees', json={
+        'base_tree': parent['tree']['sha'],
+        'tree': [
+            {'path': path, 'mode': '100644', 'type': 'blob', 'sha': blob_sha}
+            for path, blob_sha in blobs.items()
+        ]
+    })
+    commit = github_api('POST', '/git/commits', json={
+        'message': message,
+        'tree': tree['sha'],
+        'parents': [parent_sha]
+    })
+    github_api('PATCH', f"/git/refs/heads/{BACKUP_BRANCH}", json={'sha': commit['sha']})
+    return commit['sha']
+
+
+def count_components(flow_contents):
+    """Count all components including nested ones (iterative, one shared counter)"""
     stats = {
         'process_groups': 0,
         'processors': 0,
@@ -68,32 +238,17 @@ def count_components_recursive(flow_contents):
         'funnels': 0,
         'labels': 0
     }
-    
-    # Count at this level
-    stats['processors'] += len(flow_contents.get('processors', []))
-    stats['connections'] += len(flow_contents.get('connections', []))
-    stats['input_ports'] += len(flow_contents.get('inputPorts', []))
-    stats['output_ports'] += len(flow_contents.get('outputPorts', []))
-    stats['funnels'] += len(flow_contents.get('funnels', []))
-    stats['labels'] += len(flow_contents.get('labels', []))
-    
-    # Recursively count in child process groups
     # NOTE: NiFi backup format has processors DIRECTLY in processGroups array
     # NOT in processGroups[].contents or processGroups[].component.contents
-    for pg in flow_contents.get('processGroups', []):
-        stats['process_groups'] += 1
-        
-        # Processors are directly in the pg object
-        child_stats = count_components_recursive(pg)
+    stack = deque([flow_contents])
+    while stack:
+        get = stack.pop().get
+        for source_key, stats_key in COMPONENT_COUNT_KEYS:
+            stats[stats_key] += len(get(source_key, ()))
         
-        # Add child stats to total (except process_groups, we already counted that)
-        stats['processors'] += child_stats['processors']
-        stats['connections'] += child_stats['connections']
-        stats['input_ports'] += child_stats['input_ports']
-        stats['output_ports'] += child_stats['output_ports']
-        stats['funnels'] += child_stats['funnels']
-        stats['labels'] += child_stats['labels']
-        stats['process_groups'] += child_stats['process_groups']
+        child_groups = get('processGroups', ())
+        stats['process_groups'] += len(child_groups)
+        stack.extend(child_groups)
     
     return stats
 
@@ -125,39 +280,58 @@ def main():
     try:
         # Step 1: Authenticate with NiFi
         print("Step 1: Authenticating with NiFi...")
-        token = get_nifi_token()
+        get_nifi_token()
         print("  ✅ Authentication successful")
         print("")
         
         # Step 2: Get root process group
         print("Step 2: Getting root process group...")
-        root_pg_id = get_root_process_group_id(token)
+        root_pg_id = get_root_process_group_id()
         print(f"  ✅ Root PG ID: {root_pg_id}")
         print("")
         
         # Step 3: Download flow
         print("Step 3: Downloading flow from NiFi...")
-        flow_data = download_flow(token, root_pg_id)
-        print(f"  ✅ Downloaded flow ({len(flow_data):,} bytes)")
+        backup_state = load_backup_state()
+        # The ETag is only useful together with the blob it produced: an
+        # unchanged flow still gets a dated folder pointing at that blob
+        if (backup_state.get('root_process_group_id') != root_pg_id
+                or not backup_state.get('flow_blob_sha')):
+            backup_state = {}
+        flow_path, flow_etag = download_flow(root_pg_id, backup_state.get('flow_etag'))
+        if flow_path is None:
+            print("  ✅ Flow unchanged since last backup (304 Not Modified)")
+            print(f"  ♻️  Reusing blob {backup_state['flow_blob_sha'][:7]}")
+        else:
+            print(f"  ✅ Downloaded flow ({os.path.getsize(flow_path):,} bytes compressed)")
         print("")
         
         # Step 4: Parse and analyze flow
         print("Step 4: Analyzing flow structure...")
-        flow_json = json.loads(flow_data)
-        flow_contents = flow_json.get('flowContents', flow_json)
-        
-        # Use recursive counting
-        stats = count_components_recursive(flow_contents)
-        
-        print(f"  📊 Flow Statistics:")
-        print(f"     - Process Groups: {stats['process_groups']}")
-        print(f"     - Processors: {stats['processors']}")
-        print(f"     - Connections: {stats['connections']}")
-        print(f"     - Input Ports: {stats['input_ports']}")
-        print(f"     - Output Ports: {stats['output_ports']}")
-        print(f"     - Funnels: {stats['funnels']}")
-        print(f"     - Labels: {stats['labels']}")
-        print("")
+        if flow_path is None:
+            stats = backup_state.get('statistics', {})
+            print("  ⏭️  Skipped (flow unchanged, statistics from last backup)")
+            print("")
+        elif SKIP_STATS:
+            stats = {}
+            print("  ⏭️  Statistics skipped (SKIP_STATS set)")
+            print("")
+        else:
+            with gzip.open(flow_path, 'rb') as f:
+                flow_json = load_json(f)
+            flow_contents = flow_json.get('flowContents', flow_json)
+            
+            stats = count_components(flow_contents)
+            
+            print(f"  📊 Flow Statistics:")
+            print(f"     - Process Groups: {stats['process_groups']}")
+            print(f"     - Processors: {stats['processors']}")
+            print(f"     - Connections: {stats['connections']}")
+            print(f"     - Input Ports: {stats['input_ports']}")
+            print(f"     - Output Ports: {stats['output_ports']}")
+            print(f"     - Funnels: {stats['funnels']}")
+            print(f"     - Labels: {stats['labels']}")
+            print("")
         
         # Step 5: Prepare backup
         print("Step 5: Preparing backup files...")
@@ -187,65 +361,46 @@ def main():
         print(f"  🕐 Backup Time: {backup_time}")
         print("")
         
-        # Step 6: Connect to GitHub
-        print("Step 6: Connecting to GitHub...")
-        auth = Auth.Token(GITHUB_TOKEN)
-        g = Github(auth=auth)
-        repo = g.get_repo(GITHUB_REPO)
-        print("  ✅ Connected successfully")
-        print("")
-        
-        # Step 7: Upload to GitHub
-        print("Step 7: Uploading backup to GitHub...")
+        # Step 6: Upload to GitHub
+        print("Step 6: Uploading backup to GitHub...")
         backup_path = f"{BACKUP_FOLDER}/{backup_date}/{backup_time}"
         
-        # Upload flow.json.gz
+        # Create both blobs concurrently: flow.json.gz is streamed from disk,
+        # never fully in memory
         flow_file_path = f"{backup_path}/flow.json.gz"
-        flow_compressed = gzip.compress(flow_data)
+        metadata_file_path = f"{backup_path}/metadata.json.gz"
+        metadata_gz = gzip.compress(dump_json(metadata))
         
-        try:
-            repo.create_file(
-                flow_file_path,
-                f"Backup NiFi flow - {backup_date} {backup_time}",
-                flow_compressed,
-                branch=BACKUP_BRANCH
-            )
-            print(f"  ✅ Uploaded: {flow_file_path}")
-        except Exception as e:
-            print(f"  ⚠️  File may already exist, trying update...")
-            contents = repo.get_contents(flow_file_path, ref=BACKUP_BRANCH)
-            repo.update_file(
-                flow_file_path,
-                f"Update NiFi flow backup - {backup_date} {backup_time}",
-                flow_compressed,
-                contents.sha,
-                branch=BACKUP_BRANCH
-            )
-            print(f"  ✅ Updated: {flow_file_path}")
+        if flow_path is None:
+            flow_blob_sha = backup_state['flow_blob_sha']
+            metadata_blob_sha = create_blob(metadata_gz)
+        else:
+            with ThreadPoolExecutor(max_workers=2) as executor:
+                flow_future = executor.submit(create_blob_from_file, flow_path)
+                metadata_future = executor.submit(create_blob, metadata_gz)
+                flow_blob_sha = flow_future.result()
+                metadata_blob_sha = metadata_future.result()
+            os.remove(flow_path)
         
-        # Upload metadata.json
-        metadata_file_path = f"{backup_path}/metadata.json"
-        metadata_json = json.dumps(metadata, indent=2).encode('utf-8')
+        # Commit both files together (one tree, one commit, one ref update)
+        commit_sha = commit_blobs(
+            {
+                flow_file_path: flow_blob_sha,
+                metadata_file_path: metadata_blob_sha
+            },
+            f"Backup NiFi flow - {backup_date} {backup_time}"
+        )
+        print(f"  ✅ Uploaded: {flow_file_path}")
+        print(f"  ✅ Uploaded: {metadata_file_path}")
+        print(f"  📝 Commit: {commit_sha[:7]}")
         
-        try:
-            repo.create_file(
-                metadata_file_path,
-                f"Backup metadata - {backup_date} {backup_time}",
-                metadata_json,
-                branch=BACKUP_BRANCH
-            )
-            print(f"  ✅ Uploaded: {metadata_file_path}")
-        except Exception as e:
-            print(f"  ⚠️  File may already exist, trying update...")
-            contents = repo.get_contents(metadata_file_path, ref=BACKUP_BRANCH)
-            repo.update_file(
-                metadata_file_path,
-                f"Update metadata - {backup_date} {backup_time}",
-                metadata_json,
-                contents.sha,
-                branch=BACKUP_BRANCH
-            )
-            print(f"  ✅ Updated: {metadata_file_path}")
+        if flow_etag:
+            save_backup_state({
+                'root_process_group_id': root_pg_id,
+                'flow_etag': flow_etag,
+                'flow_blob_sha': flow_blob_sha,
+                'statistics': stats
+            })
         
         print("")
         print("=" * 60)
@@ -253,12 +408,13 @@ def main():
         print("=" * 60)
         print("")
         print(f"Backup location: {backup_path}")
-        print(f"Total components: {sum(stats.values())}")
+        if stats:
+            print(f"Total components: {sum(stats.values())}")
+        else:
+            print("Total components: statistics skipped")
         print("")
         print("=" * 60)
         
-        g.close()
-        
     except Exception as e:
         print(f"❌ Error: {e}")
         import traceback
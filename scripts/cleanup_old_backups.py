@@ -1,9 +1,12 @@
 #!/usr/bin/env python3
 
 import os
+import re
 import sys
 from datetime import datetime, timedelta
-from github import Github
+from functools import lru_cache
+from urllib3.util.retry import Retry
+from github import Github, GithubException, InputGitTreeElement
 
 GITHUB_TOKEN = os.environ.get('GITHUB_TOKEN')
 GITHUB_REPO = os.environ.get('GITHUB_REPO', 'medalizaidi/nifi-jar-automation-option2')
@@ -11,6 +14,12 @@ BACKUP_BRANCH = os.environ.get('BACKUP_BRANCH', 'main')
 BACKUP_FOLDER = os.environ.get('BACKUP_FOLDER', 'nifi-backups')
 RETENTION_DAYS = int(os.environ.get('RETENTION_DAYS', '15'))
 
+# Bounded retries on transient gateway errors instead of PyGithub's default
+# of up to 10 attempts
+GITHUB_RETRY = Retry(total=3, backoff_factor=0.5, status_forcelist=[502, 503, 504])
+
+DATE_FOLDER_PATTERN = re.compile(r'(\d{4})-(\d{2})-(\d{2})')
+
 
 def get_backup_folders(repo, backup_folder):
     """Get all backup date folders from GitHub"""
@@ -19,46 +28,58 @@ def get_backup_folders(repo, backup_folder):
         # Filter for directories only (date folders like 2025-01-26)
         folders = [item for item in contents if item.type == "dir"]
         return folders
-    except Exception as e:
-        if "404" in str(e):
+    except GithubException as e:
+        if e.status == 404:
             print(f"  ℹ️  Backup folder '{backup_folder}' not found")
             return []
-        raise e
+        raise
 
 
+@lru_cache(maxsize=2048)
 def parse_date_folder(folder_name):
     """Parse date from folder name (YYYY-MM-DD format)"""
+    match = DATE_FOLDER_PATTERN.fullmatch(folder_name)
+    if not match:
+        return None
     try:
-        return datetime.strptime(folder_name, '%Y-%m-%d')
+        return datetime(int(match[1]), int(match[2]), int(match[3]))
     except ValueError:
         return None
 
 
-def delete_folder_recursive(repo, path, branch):
-    """Recursively delete a folder and all its contents"""
-    try:
-        contents = repo.get_contents(path, ref=branch)
-        
-        # If it's a single file
-        if not isinstance(contents, list):
-            contents = [contents]
-        
-        # Delete all files in the folder
-        for content in contents:
-            if content.type == "dir":
-                # Recursively delete subdirectory
-                delete_folder_recursive(repo, content.path, branch)
-            else:
-                # Delete file
-                repo.delete_file(
-                    content.path,
-                    f"Cleanup: Remove old backup file {content.path}",
-                    content.sha,
-                    branch=branch
-                )
-                print(f"    ✅ Deleted file: {content.path}")
-    except Exception as e:
-        print(f"    ⚠️  Error deleting {path}: {e}")
+def delete_folders(repo, folder_paths, branch):
+    """
+    Delete several folders in a single commit via the Git Data API.
+    One recursive tree listing finds every file under the folders; the new
+    tree is built on top of the current one with those paths removed.
+    Returns the list of deleted file paths.
+    """
+    ref = repo.get_git_ref(f"heads/{branch}")
+    parent = repo.get_git_commit(ref.object.sha)
+    tree = repo.get_git_tree(parent.tree.sha, recursive=True)
+    if tree.raw_data.get('truncated'):
+        print("    ⚠️  Tree listing truncated by GitHub, some files may remain")
+    
+    prefixes = tuple(f"{path}/" for path in folder_paths)
+    deleted = [
+        entry.path for entry in tree.tree
+        if entry.type == 'blob' and entry.path.startswith(prefixes)
+    ]
+    if not deleted:
+        return deleted
+    
+    # A null SHA removes the path from the base tree
+    new_tree = repo.create_git_tree(
+        [InputGitTreeElement(path=path, mode='100644', type='blob', sha=None) for path in deleted],
+        base_tree=parent.tree
+    )
+    commit = repo.create_git_commit(
+        f"Cleanup: Remove {len(folder_paths)} old backup folder(s)",
+        new_tree,
+        [parent]
+    )
+    ref.edit(commit.sha)
+    return deleted
 
 
 def main():
@@ -89,7 +110,7 @@ def main():
     try:
         # Connect to GitHub
         print("Step 1: Connecting to GitHub...")
-        g = Github(GITHUB_TOKEN)
+        g = Github(GITHUB_TOKEN, per_page=100, retry=GITHUB_RETRY)
         repo = g.get_repo(GITHUB_REPO)
         print("  ✅ Connected successfully")
         
@@ -124,15 +145,16 @@ def main():
             print("=" * 60)
             return
         
-        # Delete old folders
+        # Delete old folders (one commit for all of them)
         print("Step 4: Deleting old backups...")
-        deleted_count = 0
-        
         for folder, folder_date in folders_to_delete:
             age_days = (datetime.utcnow() - folder_date).days
             print(f"  🗑️  Deleting: {folder.name} (age: {age_days} days)")
-            delete_folder_recursive(repo, folder.path, BACKUP_BRANCH)
-            deleted_count += 1
+        
+        deleted_files = delete_folders(repo, [folder.path for folder, _ in folders_to_delete], BACKUP_BRANCH)
+        for path in deleted_files:
+            print(f"    ✅ Deleted file: {path}")
+        deleted_count = len(folders_to_delete)
         
         print("")
         print("=" * 60)
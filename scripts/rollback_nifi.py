@@ -8,19 +8,48 @@ Usage:
   BACKUP_DATE=YYYY-MM-DD BACKUP_TIME=HH-MM-UTC python rollback_nifi.py
 """
 
+import io
 import os
+import re
 import sys
 import json
 import gzip
+import shutil
 import requests
 import argparse
+import time
 from datetime import datetime
-from github import Github, Auth
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from github import Github, Auth, GithubException
+
+# orjson is optional: it parses the flow/metadata several times faster, but
+# the stdlib parser is used when it isn't installed. orjson.JSONDecodeError
+# subclasses json.JSONDecodeError, so error handling is the same either way.
+try:
+    from orjson import loads as json_loads
+except ImportError:
+    json_loads = json.loads
 
 # Disable SSL warnings for self-signed certs
 import urllib3
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
+# Shared NiFi session: keeps one pooled keep-alive connection for all
+# API calls and retries transient gateway errors
+NIFI_SESSION = requests.Session()
+NIFI_SESSION.verify = False
+NIFI_SESSION.mount('https://', HTTPAdapter(
+    pool_connections=1,
+    pool_maxsize=32,
+    max_retries=Retry(total=3, backoff_factor=0.3, status_forcelist=[502, 503, 504])
+))
+
+# PyGithub: bounded retries on transient gateway errors, in line with the
+# NiFi session, instead of the library's default of up to 10 attempts
+GITHUB_RETRY = Retry(total=3, backoff_factor=0.5, status_forcelist=[502, 503, 504])
+
 # ===========================================
 # Configuration from Environment Variables
 # ===========================================
@@ -31,6 +60,18 @@ GITHUB_TOKEN = os.environ.get('GITHUB_TOKEN')
 GITHUB_REPO = os.environ.get('GITHUB_REPO', 'medalizaaidi/nifi-jar-automation-option2')
 BACKUP_BRANCH = os.environ.get('BACKUP_BRANCH', 'main')
 BACKUP_FOLDER = os.environ.get('BACKUP_FOLDER', 'nifi-backups')
+GITHUB_API_URL = os.environ.get('GITHUB_API_URL', 'https://api.github.com')
+
+# Streaming settings
+DOWNLOAD_CHUNK_SIZE = 65536
+GZIP_MAGIC = b'\x1f\x8b'
+# Full JSON parse of the downloaded flow: needs memory on the order of the
+# flow size, so by default only a streaming structural check is done
+VALIDATE_FLOW_JSON = os.environ.get('VALIDATE_FLOW_JSON', 'false').lower() == 'true'
+
+# NiFi auth cache: reuse a recent token for the same host
+NIFI_CACHE_FILE = os.environ.get('NIFI_CACHE_FILE', os.path.expanduser('~/.nifi-backup-cache.json'))
+NIFI_CACHE_TTL = int(os.environ.get('NIFI_CACHE_TTL', '3600'))  # seconds
 
 # Pipeline parameters (from CircleCI)
 BACKUP_DATE = os.environ.get('BACKUP_DATE', '')  # Format: YYYY-MM-DD
@@ -38,71 +79,100 @@ BACKUP_TIME = os.environ.get('BACKUP_TIME', '')  # Format: HH-MM-UTC
 
 
 def get_nifi_token():
-    """Authenticate with NiFi and get access token"""
+    """Authenticate with NiFi, attach the token to the shared session and return it"""
     url = f"{NIFI_HOST}/nifi-api/access/token"
-    response = requests.post(
+    response = NIFI_SESSION.post(
         url,
         data={'username': NIFI_USERNAME, 'password': NIFI_PASSWORD},
-        verify=False,
         timeout=30
     )
     response.raise_for_status()
-    return response.text
+    token = response.text
+    NIFI_SESSION.headers['Authorization'] = f'Bearer {token}'
+    return token
 
 
-def get_root_process_group_id(token):
+def get_root_process_group_id():
     """Get the root process group ID"""
     url = f"{NIFI_HOST}/nifi-api/flow/process-groups/root"
-    headers = {'Authorization': f'Bearer {token}'}
-    response = requests.get(url, headers=headers, verify=False, timeout=30)
+    response = NIFI_SESSION.get(url, timeout=30)
     response.raise_for_status()
-    return response.json()['processGroupFlow']['id']
+    return json_loads(response.content)['processGroupFlow']['id']
 
 
-def get_process_group_version(token, process_group_id):
+def load_nifi_cache():
+    """Return the cached token for NIFI_HOST, or None if missing/expired"""
+    try:
+        with open(NIFI_CACHE_FILE, 'rb') as f:
+            cache = json_loads(f.read())
+    except (OSError, ValueError):
+        return None
+    if cache.get('host') != NIFI_HOST or time.time() >= cache.get('expires', 0) - 60:
+        return None
+    return cache.get('token')
+
+
+def save_nifi_cache(token):
+    """Cache the token for NIFI_HOST (owner-only permissions)"""
+    cache = {
+        'host': NIFI_HOST,
+        'token': token,
+        'expires': int(time.time()) + NIFI_CACHE_TTL
+    }
+    try:
+        fd = os.open(NIFI_CACHE_FILE, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'w') as f:
+            json.dump(cache, f)
+    except OSError:
+        pass
+
+
+def clear_nifi_cache():
+    """Drop the cached token (e.g. after NiFi rejected it)"""
+    try:
+        os.remove(NIFI_CACHE_FILE)
+    except OSError:
+        pass
+
+
+def get_process_group_version(process_group_id):
     """Get the current version of the process group"""
     url = f"{NIFI_HOST}/nifi-api/process-groups/{process_group_id}"
-    headers = {'Authorization': f'Bearer {token}'}
-    response = requests.get(url, headers=headers, verify=False, timeout=30)
+    response = NIFI_SESSION.get(url, timeout=30)
     response.raise_for_status()
-    return response.json()['revision']['version']
+    return json_loads(response.content)['revision']['version']
 
 
-def stop_all_processors(token, process_group_id):
+def stop_all_processors(process_group_id):
     """Stop all processors in the process group"""
     url = f"{NIFI_HOST}/nifi-api/flow/process-groups/{process_group_id}"
-    headers = {'Authorization': f'Bearer {token}'}
-    response = requests.get(url, headers=headers, verify=False, timeout=30)
+    response = NIFI_SESSION.get(url, timeout=30)
     response.raise_for_status()
     
-    flow = response.json()['processGroupFlow']['flow']
+    flow = json_loads(response.content)['processGroupFlow']['flow']
     processors = flow.get('processors', [])
     
     stopped_count = 0
     for processor in processors:
         if processor['status']['runStatus'] == 'Running':
-            stop_processor(token, processor['id'], processor['revision']['version'])
+            stop_processor(processor['id'], processor['revision']['version'])
             stopped_count += 1
     
     return stopped_count
 
 
-def stop_processor(token, processor_id, version):
+def stop_processor(processor_id, version):
     """Stop a specific processor"""
     url = f"{NIFI_HOST}/nifi-api/processors/{processor_id}"
-    headers = {
-        'Authorization': f'Bearer {token}',
-        'Content-Type': 'application/json'
-    }
     payload = {
         'revision': {'version': version},
         'component': {'id': processor_id, 'state': 'STOPPED'}
     }
-    response = requests.put(url, headers=headers, json=payload, verify=False, timeout=30)
+    response = NIFI_SESSION.put(url, json=payload, timeout=30)
     response.raise_for_status()
 
 
-def upload_flow_version(token, process_group_id, flow_content):
+def upload_flow_version(process_group_id, flow_content):
     """Upload a flow version to NiFi (replace existing flow)"""
     # Note: NiFi doesn't have a direct "restore from backup" API
     # This is a simplified approach - in production you may need to:
@@ -113,40 +183,35 @@ def upload_flow_version(token, process_group_id, flow_content):
     
     # For now, we'll use the process group upload endpoint
     url = f"{NIFI_HOST}/nifi-api/process-groups/{process_group_id}/process-groups/upload"
-    headers = {
-        'Authorization': f'Bearer {token}',
-        'Content-Type': 'application/json'
-    }
+    headers = {'Content-Type': 'application/json'}
     
     # The flow_content is the backup JSON
-    response = requests.post(
+    response = NIFI_SESSION.post(
         url, 
         headers=headers, 
         data=flow_content,
-        verify=False, 
         timeout=120
     )
     response.raise_for_status()
-    return response.json()
+    return json_loads(response.content)
 
 
 def list_available_backups(repo, backup_folder):
-    """List all available backups"""
+    """List all available backups (one recursive tree fetch for the branch)"""
     try:
-        contents = repo.get_contents(backup_folder, ref=BACKUP_BRANCH)
-        date_folders = [item for item in contents if item.type == "dir"]
+        tree = repo.get_git_tree(BACKUP_BRANCH, recursive=True)
+        time_folder_pattern = re.compile(re.escape(backup_folder) + r'/([^/]+)/([^/]+)')
         
         backups = []
-        for date_folder in date_folders:
-            # Get time folders within each date
-            time_contents = repo.get_contents(date_folder.path, ref=BACKUP_BRANCH)
-            time_folders = [item for item in time_contents if item.type == "dir"]
-            
-            for time_folder in time_folders:
+        for entry in tree.tree:
+            if entry.type != 'tree':
+                continue
+            match = time_folder_pattern.fullmatch(entry.path)
+            if match:
                 backups.append({
-                    'date': date_folder.name,
-                    'time': time_folder.name,
-                    'path': time_folder.path
+                    'date': match.group(1),
+                    'time': match.group(2),
+                    'path': entry.path
                 })
         
         return sorted(backups, key=lambda x: (x['date'], x['time']), reverse=True)
@@ -154,34 +219,89 @@ def list_available_backups(repo, backup_folder):
         return []
 
 
-def download_backup(repo, backup_path):
-    """Download backup files from GitHub"""
-    try:
-        # Get flow.json.gz
-        flow_file = repo.get_contents(f"{backup_path}/flow.json.gz", ref=BACKUP_BRANCH)
-        flow_content = flow_file.decoded_content
+def download_flow_file(backup_path, output_file):
+    """
+    Stream flow.json.gz from the backup branch to output_file as plain JSON.
+    The raw contents endpoint is read in chunks and gunzipped on the fly, so
+    the flow is never held in memory. Returns True if the file was gzipped.
+    """
+    url = f"{GITHUB_API_URL}/repos/{GITHUB_REPO}/contents/{backup_path}/flow.json.gz"
+    headers = {
+        'Authorization': f'token {GITHUB_TOKEN}',
+        'Accept': 'application/vnd.github.raw'
+    }
+    with requests.get(url, headers=headers, params={'ref': BACKUP_BRANCH},
+                      timeout=120, stream=True) as response:
+        response.raise_for_status()
         
-        # Get metadata.json
-        metadata_file = repo.get_contents(f"{backup_path}/metadata.json", ref=BACKUP_BRANCH)
-        metadata_content = metadata_file.decoded_content
-        metadata = json.loads(metadata_content)
+        # decode_content undoes any transport-level gzip; the stored file
+        # may still be gzipped itself (older backups are plain JSON).
+        # auto_close is off so the buffered reader can hit EOF cleanly.
+        response.raw.decode_content = True
+        response.raw.auto_close = False
+        stream = io.BufferedReader(response.raw, DOWNLOAD_CHUNK_SIZE)
+        is_gzipped = stream.peek(2)[:2] == GZIP_MAGIC
+        source = gzip.GzipFile(fileobj=stream) if is_gzipped else stream
+        with open(output_file, 'wb') as f:
+            shutil.copyfileobj(source, f, DOWNLOAD_CHUNK_SIZE)
+    return is_gzipped
+
+
+def check_flow_file(path):
+    """
+    Check that path holds a JSON object without loading it: the file must be
+    non-empty and start with '{'. GzipFile has already verified the CRC of
+    compressed downloads at EOF. Peak memory is one DOWNLOAD_CHUNK_SIZE chunk;
+    set VALIDATE_FLOW_JSON=true for a full parse (memory ~ flow size).
+    """
+    if VALIDATE_FLOW_JSON:
+        with open(path, 'rb') as f:
+            json_loads(f.read())
+        return
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(DOWNLOAD_CHUNK_SIZE), b''):
+            chunk = chunk.lstrip()
+            if chunk:
+                if chunk[:1] != b'{':
+                    raise json.JSONDecodeError("Expected a JSON object", chunk[:20].decode('utf-8', 'replace'), 0)
+                return
+    raise json.JSONDecodeError("Empty flow file", '', 0)
+
+
+def download_metadata(repo, backup_path):
+    """Fetch backup metadata: metadata.json.gz, or metadata.json for older backups"""
+    try:
+        metadata_file = repo.get_contents(f"{backup_path}/metadata.json.gz", ref=BACKUP_BRANCH)
+        return json_loads(gzip.decompress(metadata_file.decoded_content))
+    except GithubException as e:
+        if e.status != 404:
+            raise
+    metadata_file = repo.get_contents(f"{backup_path}/metadata.json", ref=BACKUP_BRANCH)
+    return json_loads(metadata_file.decoded_content)
+
+
+def download_backup(repo, backup_path, output_file):
+    """Download backup files from GitHub; the flow is written to output_file"""
+    try:
+        # Get flow.json.gz and metadata concurrently
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            flow_future = executor.submit(download_flow_file, backup_path, output_file)
+            metadata_future = executor.submit(download_metadata, repo, backup_path)
+            is_gzipped = flow_future.result()
+            metadata = metadata_future.result()
         
-        # Try to decompress flow - handle both gzipped and plain JSON
-        try:
-            flow_json = gzip.decompress(flow_content)
+        if is_gzipped:
             print(f"  ℹ️  File was gzip compressed")
-        except gzip.BadGzipFile:
-            # File is not gzipped, use as-is
-            flow_json = flow_content
+        else:
             print(f"  ℹ️  File is plain JSON (not compressed)")
         
-        # Validate it's valid JSON
+        # Validate it's a JSON object (structural check unless VALIDATE_FLOW_JSON)
         try:
-            json.loads(flow_json)
+            check_flow_file(output_file)
         except json.JSONDecodeError as e:
             raise Exception(f"Downloaded file is not valid JSON: {e}")
         
-        return flow_json, metadata
+        return os.path.getsize(output_file), metadata
     except Exception as e:
         raise Exception(f"Failed to download backup: {e}")
 
@@ -231,7 +351,7 @@ def main():
         # Step 1: Connect to GitHub with modern authentication
         print("Step 1: Connecting to GitHub...")
         auth = Auth.Token(GITHUB_TOKEN)
-        g = Github(auth=auth)
+        g = Github(auth=auth, per_page=100, retry=GITHUB_RETRY)
         
         # Verify authentication and repository access
         try:
@@ -332,36 +452,53 @@ def main():
             print("  ❌ BACKUP_TIME not specified")
             print("")
             print("Available times for this date:")
-            date_path = f"{BACKUP_FOLDER}/{BACKUP_DATE}"
-            try:
-                time_contents = repo.get_contents(date_path, ref=BACKUP_BRANCH)
-                time_folders = [item.name for item in time_contents if item.type == "dir"]
-                for time in sorted(time_folders):
-                    print(f"    - {time}")
-            except:
+            time_folders = [
+                backup['time'] for backup in list_available_backups(repo, BACKUP_FOLDER)
+                if backup['date'] == BACKUP_DATE
+            ]
+            for time_folder in sorted(time_folders):
+                print(f"    - {time_folder}")
+            if not time_folders:
                 print("    (No backups found for this date)")
             sys.exit(1)
         
         backup_path = f"{BACKUP_FOLDER}/{BACKUP_DATE}/{BACKUP_TIME}"
         print(f"  📁 Backup path: {backup_path}")
         
-        # Step 4: Download backup
+        # Step 4: Download backup (streamed straight to the output file)
         print("Step 3: Downloading backup from GitHub...")
-        flow_json, metadata = download_backup(repo, backup_path)
-        print(f"  ✅ Downloaded backup ({len(flow_json):,} bytes)")
+        output_file = f"/tmp/nifi-rollback-{BACKUP_DATE}-{BACKUP_TIME}.json"
+        flow_size, metadata = download_backup(repo, backup_path, output_file)
+        print(f"  ✅ Downloaded backup ({flow_size:,} bytes)")
         print(f"  📊 Backup metadata:")
         print(f"     - Timestamp: {metadata.get('backup_timestamp', 'N/A')}")
         print(f"     - Processors: {metadata.get('statistics', {}).get('processors', 0)}")
         print(f"     - Connections: {metadata.get('statistics', {}).get('connections', 0)}")
         
-        # Step 5: Authenticate with NiFi
+        # Step 5: Authenticate with NiFi (reuse a recent cached token if any)
         print("Step 4: Authenticating with NiFi...")
-        token = get_nifi_token()
-        print("  ✅ Authentication successful")
+        root_pg_id = None
+        token = load_nifi_cache()
+        if token:
+            # The root PG lookup doubles as the check that the token still works
+            NIFI_SESSION.headers['Authorization'] = f'Bearer {token}'
+            try:
+                root_pg_id = get_root_process_group_id()
+                print("  ✅ Reusing cached token")
+            except requests.exceptions.HTTPError as e:
+                if e.response is None or e.response.status_code != 401:
+                    raise
+                print("  ⚠️  Cached token rejected, re-authenticating")
+                clear_nifi_cache()
+        if root_pg_id is None:
+            token = get_nifi_token()
+            print("  ✅ Authentication successful")
         
         # Step 6: Get root process group
         print("Step 5: Getting root process group...")
-        root_pg_id = get_root_process_group_id(token)
+        if root_pg_id is None:
+            root_pg_id = get_root_process_group_id()
+            save_nifi_cache(token)
         print(f"  ✅ Root PG ID: {root_pg_id}")
         
         # Step 7: Create pre-rollback backup
@@ -375,7 +512,7 @@ def main():
         print("Step 7: Stopping all processors...")
         print("  ⚠️  This will stop all running processors")
         print("  ℹ️  Implement this in production for safe rollback")
-        # stopped_count = stop_all_processors(token, root_pg_id)
+        # stopped_count = stop_all_processors(root_pg_id)
         # print(f"  ✅ Stopped {stopped_count} processors")
         
         # Step 9: Display rollback plan
@@ -427,16 +564,13 @@ def main():
         print(f"Backup file downloaded to: /tmp/nifi-rollback-{BACKUP_DATE}-{BACKUP_TIME}.json")
         print("=" * 60)
         
-        # Save flow to temp file for manual upload
-        output_file = f"/tmp/nifi-rollback-{BACKUP_DATE}-{BACKUP_TIME}.json"
-        with open(output_file, 'wb') as f:
-            f.write(flow_json)
+        # Flow was already streamed to the temp file for manual upload
         print(f"✅ Backup saved locally: {output_file}")
         
         # Save metadata for artifacts
         metadata_output = "/tmp/rollback-metadata.json"
         with open(metadata_output, 'w') as f:
-            json.dump({
+            f.write(json.dumps({
                 'backup_date': BACKUP_DATE,
                 'backup_time': BACKUP_TIME,
                 'backup_path': backup_path,
@@ -444,9 +578,9 @@ def main():
                 'root_process_group_id': root_pg_id,
                 'downloaded_at': datetime.utcnow().isoformat() + 'Z',
                 'backup_metadata': metadata,
-                'file_size_bytes': len(flow_json),
+                'file_size_bytes': flow_size,
                 'output_file': output_file
-            }, f, indent=2)
+            }, indent=2))
         print(f"✅ Metadata saved: {metadata_output}")
         
         print("")
@@ -464,6 +598,9 @@ def main():
         print(f"   Details: {e}")
         sys.exit(1)
     except requests.exceptions.HTTPError as e:
+        if e.response is not None and e.response.status_code == 401:
+            # Stale cached token: force a fresh login on the next run
+            clear_nifi_cache()
         print(f"❌ HTTP Error: {e}")
         sys.exit(1)
     except Exception as e:
@@ -8,18 +8,63 @@ Usage:
 
 import os
 import sys
+import io
 import json
 import gzip
+import hashlib
 import requests
 import time
 import argparse
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from github import Github, Auth
 
+# orjson is optional: it parses the flow and serializes the per-component
+# payloads several times faster, but the stdlib codec is used when it isn't
+# installed. orjson.JSONDecodeError subclasses json.JSONDecodeError.
+try:
+    import orjson
+    
+    def load_json(f):
+        return orjson.loads(f.read())
+    
+    def dump_json(obj):
+        return orjson.dumps(obj)
+except ImportError:
+    def load_json(f):
+        return json.load(f)
+    
+    def dump_json(obj):
+        return json.dumps(obj, separators=(',', ':')).encode('utf-8')
+
 # Disable SSL warnings for self-signed certs
 import urllib3
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
+# Shared NiFi session: keeps pooled keep-alive connections for the many
+# per-component API calls and retries transient errors
+NIFI_SESSION = requests.Session()
+NIFI_SESSION.verify = False
+NIFI_SESSION.mount('https://', HTTPAdapter(
+    pool_connections=16,
+    pool_maxsize=64,
+    max_retries=Retry(total=3, backoff_factor=0.3, status_forcelist=[429, 502, 503, 504])
+))
+
+# Shared pool for independent per-component calls (stop/delete/import of one
+# component type within one group); stays well below the session pool size
+NIFI_WORKERS = 16
+NIFI_EXECUTOR = ThreadPoolExecutor(max_workers=NIFI_WORKERS)
+
+# Payloads are pre-serialized with dump_json and sent as the request body
+JSON_HEADERS = {'Content-Type': 'application/json'}
+
+# After stopping processors, poll until their threads finish (bounded)
+STOP_WAIT_TIMEOUT = 30
+STOP_POLL_INTERVAL = 0.5
+
 # ===========================================
 # Configuration from Environment Variables
 # ===========================================
@@ -30,6 +75,7 @@ GITHUB_TOKEN = os.environ.get('GITHUB_TOKEN')
 GITHUB_REPO = os.environ.get('GITHUB_REPO', 'medalizaidi/nifi-jar-automation-option2')
 BACKUP_BRANCH = os.environ.get('BACKUP_BRANCH', 'main')
 BACKUP_FOLDER = os.environ.get('BACKUP_FOLDER', 'nifi-backups')
+NIFI_API = f"{NIFI_HOST}/nifi-api"
 
 # Pipeline parameters (from CircleCI)
 BACKUP_DATE = os.environ.get('BACKUP_DATE', '')  # Format: YYYY-MM-DD
@@ -39,524 +85,478 @@ BACKUP_TIME = os.environ.get('BACKUP_TIME', '')  # Format: HH-MM-JST or HH-MM-UT
 AUTO_CONFIRM = os.environ.get('AUTO_CONFIRM', 'false').lower() == 'true'
 STOP_PROCESSORS = os.environ.get('STOP_PROCESSORS', 'true').lower() == 'true'
 CREATE_PRE_BACKUP = os.environ.get('CREATE_PRE_BACKUP', 'true').lower() == 'true'
+# Per-component progress lines (stopped/deleted/imported); counts and
+# warnings are always printed
+VERBOSE = os.environ.get('VERBOSE', 'false').lower() == 'true'
+
+# GitHub raw downloads: the contents endpoint with the raw media type returns
+# file bytes directly instead of a base64 JSON envelope
+GITHUB_API_URL = os.environ.get('GITHUB_API_URL', 'https://api.github.com')
+GITHUB_SESSION = requests.Session()
+GITHUB_SESSION.headers.update({
+    'Authorization': f'token {GITHUB_TOKEN}',
+    'Accept': 'application/vnd.github.raw'
+})
+GZIP_MAGIC = b'\x1f\x8b'
+
+# Downloaded backup flows are kept here with their ETag; a repeated rollback
+# sends If-None-Match and reuses the file on 304 (not counted against the
+# GitHub rate limit). Kept out of /tmp, which CI publishes as artifacts.
+GITHUB_CACHE_DIR = os.environ.get('GITHUB_CACHE_DIR', os.path.expanduser('~/.cache/nifi-backup'))
+
+# Backup listing, keyed by the backup folder's tree SHA: unchanged folder,
+# unchanged listing
+BACKUP_LIST_CACHE_FILE = os.environ.get('BACKUP_LIST_CACHE_FILE', os.path.join(GITHUB_CACHE_DIR, 'backup-list.json'))
 
 
 def get_nifi_token():
-    """Authenticate with NiFi and get access token"""
-    url = f"{NIFI_HOST}/nifi-api/access/token"
-    response = requests.post(
+    """Authenticate with NiFi and attach the token to the shared session"""
+    url = f"{NIFI_API}/access/token"
+    response = NIFI_SESSION.post(
         url,
         data={'username': NIFI_USERNAME, 'password': NIFI_PASSWORD},
-        verify=False,
         timeout=30
     )
     response.raise_for_status()
-    return response.text
+    NIFI_SESSION.headers['Authorization'] = f'Bearer {response.text}'
 
 
-def get_root_process_group_id(token):
+def get_root_process_group_id():
     """Get the root process group ID"""
-    url = f"{NIFI_HOST}/nifi-api/flow/process-groups/root"
-    headers = {'Authorization': f'Bearer {token}'}
-    response = requests.get(url, headers=headers, verify=False, timeout=30)
+    url = f"{NIFI_API}/flow/process-groups/root"
+    response = NIFI_SESSION.get(url, timeout=30)
     response.raise_for_status()
     return response.json()['processGroupFlow']['id']
 
 
-def get_process_group_details(token, process_group_id):
+def get_process_group_details(process_group_id):
     """Get process group details including version"""
-    url = f"{NIFI_HOST}/nifi-api/process-groups/{process_group_id}"
-    headers = {'Authorization': f'Bearer {token}'}
-    response = requests.get(url, headers=headers, verify=False, timeout=30)
+    url = f"{NIFI_API}/process-groups/{process_group_id}"
+    response = NIFI_SESSION.get(url, timeout=30)
     response.raise_for_status()
     return response.json()
 
 
-def get_all_components(token, process_group_id):
+def get_all_components(process_group_id):
     """Get all components in a process group"""
-    url = f"{NIFI_HOST}/nifi-api/flow/process-groups/{process_group_id}"
-    headers = {'Authorization': f'Bearer {token}'}
-    response = requests.get(url, headers=headers, verify=False, timeout=30)
+    url = f"{NIFI_API}/flow/process-groups/{process_group_id}"
+    response = NIFI_SESSION.get(url, timeout=30)
     response.raise_for_status()
     return response.json()['processGroupFlow']['flow']
 
 
-def stop_processor(token, processor_id, version):
+def stop_processor(processor_id, version):
     """Stop a specific processor"""
-    url = f"{NIFI_HOST}/nifi-api/processors/{processor_id}"
-    headers = {
-        'Authorization': f'Bearer {token}',
-        'Content-Type': 'application/json'
-    }
+    url = f"{NIFI_API}/processors/{processor_id}"
     payload = {
         'revision': {'version': version},
         'component': {'id': processor_id, 'state': 'STOPPED'}
     }
-    response = requests.put(url, headers=headers, json=payload, verify=False, timeout=30)
+    response = NIFI_SESSION.put(url, data=dump_json(payload), headers=JSON_HEADERS, timeout=30)
     response.raise_for_status()
     return response.json()
 
 
-def stop_all_processors(token, process_group_id):
-    """Stop all processors in the process group recursively"""
+def get_all_components_bulk(process_group_ids):
+    """Fetch several process groups' flows concurrently, in the given order"""
+    return list(NIFI_EXECUTOR.map(get_all_components, process_group_ids))
+
+
+def get_flow_tree(process_group_id):
+    """
+    Walk the process group tree breadth-first; each level's flows are
+    fetched together.
+    Returns a list of levels; each level is a list of (group, flow) pairs,
+    where group is the group entry from its parent's listing (None for the
+    starting group) and flow is its get_all_components() result.
+    """
+    levels = []
+    level = [(None, process_group_id)]
+    while level:
+        groups = [group for group, _ in level]
+        flows = list(zip(groups, get_all_components_bulk([pg_id for _, pg_id in level])))
+        levels.append(flows)
+        level = [
+            (child_group, child_group['id'])
+            for _, flow in flows
+            for child_group in flow.get('processGroups', [])
+        ]
+    return levels
+
+
+def stop_all_processors(process_group_id, levels=None):
+    """
+    Stop all processors in the process group and its descendants.
+    levels is an already fetched get_flow_tree() result; stopped processors'
+    revisions are updated in it so it can be reused for deletion.
+    """
     print("  🛑 Stopping all processors...")
     
-    flow = get_all_components(token, process_group_id)
+    if levels is None:
+        levels = get_flow_tree(process_group_id)
     stopped_count = 0
     
-    # Stop processors in this group
-    processors = flow.get('processors', [])
-    for processor in processors:
-        if processor['status']['runStatus'] in ['Running', 'Validating']:
+    # Each level's running processors are stopped concurrently, reported in order
+    for level in levels:
+        processors = [
+            processor
+            for _, flow in level
+            for processor in flow.get('processors', [])
+            if processor['status']['runStatus'] in ['Running', 'Validating']
+        ]
+        futures = [
+            NIFI_EXECUTOR.submit(stop_processor, processor['id'], processor['revision']['version'])
+            for processor in processors
+        ]
+        for processor, future in zip(processors, futures):
             try:
-                stop_processor(token, processor['id'], processor['revision']['version'])
+                processor['revision'] = future.result()['revision']
                 stopped_count += 1
-                print(f"     Stopped: {processor['component']['name']}")
+                if VERBOSE:
+                    print(f"     Stopped: {processor['component']['name']}")
             except Exception as e:
                 print(f"     Warning: Could not stop {processor['component']['name']}: {e}")
     
-    # Recursively stop processors in child groups
-    child_groups = flow.get('processGroups', [])
-    for child_group in child_groups:
-        stopped_count += stop_all_processors(token, child_group['id'])
-    
     return stopped_count
 
 
-def delete_component(token, component_type, component_id, version):
+def wait_for_processors_to_stop(process_group_id):
+    """
+    Poll the process group status until no threads are active anywhere in
+    its tree. Returns the active thread count left (0 once stopped).
+    """
+    url = f"{NIFI_API}/flow/process-groups/{process_group_id}/status"
+    deadline = time.monotonic() + STOP_WAIT_TIMEOUT
+    while True:
+        response = NIFI_SESSION.get(url, timeout=30)
+        response.raise_for_status()
+        snapshot = response.json()['processGroupStatus']['aggregateSnapshot']
+        active_threads = snapshot.get('activeThreadCount', 0)
+        if active_threads == 0 or time.monotonic() >= deadline:
+            return active_threads
+        time.sleep(STOP_POLL_INTERVAL)
+
+
+def delete_component(component_type, component_id, version):
     """Delete a component from NiFi"""
-    url = f"{NIFI_HOST}/nifi-api/{component_type}/{component_id}"
-    headers = {'Authorization': f'Bearer {token}'}
+    url = f"{NIFI_API}/{component_type}/{component_id}"
     params = {'version': version}
     
-    response = requests.delete(url, headers=headers, params=params, verify=False, timeout=30)
+    response = NIFI_SESSION.delete(url, params=params, timeout=30)
     response.raise_for_status()
 
 
-def delete_all_components(token, process_group_id):
-    """Delete all components from a process group"""
+def delete_components(component_type, components):
+    """
+    Delete components of one type concurrently on the shared pool.
+    Yields (component, error) in the original order; error is None on success.
+    """
+    futures = [
+        NIFI_EXECUTOR.submit(delete_component, component_type, component['id'], component['revision']['version'])
+        for component in components
+    ]
+    for component, future in zip(components, futures):
+        try:
+            future.result()
+            yield component, None
+        except Exception as e:
+            yield component, e
+
+
+def delete_all_components(process_group_id, levels=None):
+    """
+    Delete all components from a process group and its descendants.
+    levels is an already fetched get_flow_tree() result, if any.
+    """
     print("  🗑️  Deleting existing components...")
     
-    flow = get_all_components(token, process_group_id)
+    # Pass 1: collect the whole tree level by level
+    if levels is None:
+        levels = get_flow_tree(process_group_id)
+    flows = [flow for level in levels for _, flow in level]
     deleted_count = 0
     
-    # Delete in order: connections, processors, child process groups, ports, funnels
+    # Pass 2: delete in order: connections, processors, ports, funnels, then
+    # process groups. Each type is deleted across the whole tree at once, so
+    # every connection (including ones into child group ports) is gone
+    # before any processor or port is removed.
     
     # 1. Delete connections first
-    for connection in flow.get('connections', []):
-        try:
-            delete_component(token, 'connections', connection['id'], connection['revision']['version'])
+    connections = [c for flow in flows for c in flow.get('connections', [])]
+    for connection, error in delete_components('connections', connections):
+        if error:
+            print(f"     Warning: Could not delete connection: {error}")
+        else:
             deleted_count += 1
-            print(f"     Deleted connection: {connection['id'][:8]}...")
-        except Exception as e:
-            print(f"     Warning: Could not delete connection: {e}")
+            if VERBOSE:
+                print(f"     Deleted connection: {connection['id'][:8]}...")
     
     # 2. Delete processors
-    for processor in flow.get('processors', []):
-        try:
-            delete_component(token, 'processors', processor['id'], processor['revision']['version'])
+    processors = [p for flow in flows for p in flow.get('processors', [])]
+    for processor, error in delete_components('processors', processors):
+        if error:
+            print(f"     Warning: Could not delete processor: {error}")
+        else:
             deleted_count += 1
-            print(f"     Deleted processor: {processor['component']['name']}")
-        except Exception as e:
-            print(f"     Warning: Could not delete processor: {e}")
+            if VERBOSE:
+                print(f"     Deleted processor: {processor['component']['name']}")
     
     # 3. Delete input ports
-    for port in flow.get('inputPorts', []):
-        try:
-            delete_component(token, 'input-ports', port['id'], port['revision']['version'])
+    ports = [p for flow in flows for p in flow.get('inputPorts', [])]
+    for port, error in delete_components('input-ports', ports):
+        if error:
+            print(f"     Warning: Could not delete input port: {error}")
+        else:
             deleted_count += 1
-            print(f"     Deleted input port: {port['component']['name']}")
-        except Exception as e:
-            print(f"     Warning: Could not delete input port: {e}")
+            if VERBOSE:
+                print(f"     Deleted input port: {port['component']['name']}")
     
     # 4. Delete output ports
-    for port in flow.get('outputPorts', []):
-        try:
-            delete_component(token, 'output-ports', port['id'], port['revision']['version'])
+    ports = [p for flow in flows for p in flow.get('outputPorts', [])]
+    for port, error in delete_components('output-ports', ports):
+        if error:
+            print(f"     Warning: Could not delete output port: {error}")
+        else:
             deleted_count += 1
-            print(f"     Deleted output port: {port['component']['name']}")
-        except Exception as e:
-            print(f"     Warning: Could not delete output port: {e}")
+            if VERBOSE:
+                print(f"     Deleted output port: {port['component']['name']}")
     
     # 5. Delete funnels
-    for funnel in flow.get('funnels', []):
-        try:
-            delete_component(token, 'funnels', funnel['id'], funnel['revision']['version'])
-            deleted_count += 1
-            print(f"     Deleted funnel")
-        except Exception as e:
-            print(f"     Warning: Could not delete funnel: {e}")
-    
-    # 6. Delete child process groups (recursive)
-    for child_group in flow.get('processGroups', []):
-        try:
-            # First delete contents of child group
-            delete_all_components(token, child_group['id'])
-            # Then delete the group itself
-            delete_component(token, 'process-groups', child_group['id'], child_group['revision']['version'])
+    funnels = [f for flow in flows for f in flow.get('funnels', [])]
+    for funnel, error in delete_components('funnels', funnels):
+        if error:
+            print(f"     Warning: Could not delete funnel: {error}")
+        else:
             deleted_count += 1
-            print(f"     Deleted process group: {child_group['component']['name']}")
-        except Exception as e:
-            print(f"     Warning: Could not delete process group: {e}")
+            if VERBOSE:
+                print(f"     Deleted funnel")
+    
+    # 6. Delete child process groups bottom-up (deepest level first), so each
+    # group is already empty when it is removed
+    for level in reversed(levels[1:]):
+        child_groups = [group for group, _ in level]
+        for child_group, error in delete_components('process-groups', child_groups):
+            if error:
+                print(f"     Warning: Could not delete process group: {error}")
+            else:
+                deleted_count += 1
+                if VERBOSE:
+                    print(f"     Deleted process group: {child_group['component']['name']}")
     
     print(f"  ✅ Deleted {deleted_count} components")
     return deleted_count
 
 
-def import_process_group_recursively(token, parent_pg_id, pg_data):
-    """Recursively import a process group and all its contents
-    
-    NOTE: NiFi backup format has components DIRECTLY in the processGroup object,
-    NOT in a nested 'contents' or 'component.contents' structure
-    """
-    
-    # Create the process group
-    import_url = f"{NIFI_HOST}/nifi-api/process-groups/{parent_pg_id}/process-groups"
-    headers = {
-        'Authorization': f'Bearer {token}',
-        'Content-Type': 'application/json'
-    }
-    
-    payload = {
-        'revision': {'version': 0},
-        'component': {
-            'name': pg_data.get('name', 'Imported Process Group'),
-            'position': pg_data.get('position', {'x': 0, 'y': 0})
+def post_json(url, payload):
+    """POST a JSON payload to NiFi"""
+    return NIFI_SESSION.post(url, data=dump_json(payload), headers=JSON_HEADERS, timeout=60)
+
+
+def build_processor_component(processor):
+    """Build a processor create payload - need to extract just the necessary fields"""
+    get = processor.get
+    return {
+        'name': get('name'),
+        'type': get('type'),
+        'bundle': get('bundle'),
+        'position': get('position', {'x': 0, 'y': 0}),
+        'style': get('style', {}),
+        'config': {
+            'properties': get('properties', {}),
+            'schedulingPeriod': get('schedulingPeriod', '0 sec'),
+            'schedulingStrategy': get('schedulingStrategy', 'TIMER_DRIVEN'),
+            'executionNode': get('executionNode', 'ALL'),
+            'penaltyDuration': get('penaltyDuration', '30 sec'),
+            'yieldDuration': get('yieldDuration', '1 sec'),
+            'bulletinLevel': get('bulletinLevel', 'WARN'),
+            'runDurationMillis': get('runDurationMillis', 0),
+            'concurrentlySchedulableTaskCount': get('concurrentlySchedulableTaskCount', 1),
+            'autoTerminatedRelationships': get('autoTerminatedRelationships', [])
         }
     }
+
+
+def build_connection_component(connection):
+    """Build a connection create payload from a backup connection"""
+    get = connection.get
+    return {
+        'name': get('name', ''),
+        'source': get('source'),
+        'destination': get('destination'),
+        'selectedRelationships': get('selectedRelationships', []),
+        'backPressureDataSizeThreshold': get('backPressureDataSizeThreshold', '1 GB'),
+        'backPressureObjectThreshold': get('backPressureObjectThreshold', 10000),
+        'flowFileExpiration': get('flowFileExpiration', '0 sec'),
+        'prioritizers': get('prioritizers', []),
+        'bends': get('bends', [])
+    }
+
+
+def build_port_component(port):
+    """Build an input/output port create payload from a backup port"""
+    return {
+        'name': port.get('name'),
+        'position': port.get('position', {'x': 0, 'y': 0})
+    }
+
+
+def build_funnel_component(funnel):
+    """Build a funnel create payload from a backup funnel"""
+    return {
+        'position': funnel.get('position', {'x': 0, 'y': 0})
+    }
+
+
+# (flow key, endpoint, label, payload builder, show name) per component type,
+# in creation order: connections come last, once the processors, ports and
+# funnels they join exist
+COMPONENT_IMPORTS = (
+    ('processors', 'processors', 'processor', build_processor_component, True),
+    ('inputPorts', 'input-ports', 'input port', build_port_component, True),
+    ('outputPorts', 'output-ports', 'output port', build_port_component, True),
+    ('funnels', 'funnels', 'funnel', build_funnel_component, False),
+    ('connections', 'connections', 'connection', build_connection_component, False),
+)
+
+
+def import_components(groups, flow_key, endpoint, label, build_component, show_name=True):
+    """
+    Create one component type in several new process groups concurrently.
+    groups is a list of (new_pg_id, pg_data); returns the number created.
+    """
+    items = []
+    futures = []
+    submit = NIFI_EXECUTOR.submit
+    for new_pg_id, pg_data in groups:
+        url = f"{NIFI_API}/process-groups/{new_pg_id}/{endpoint}"
+        group_items = pg_data.get(flow_key, [])
+        items.extend(group_items)
+        futures.extend(
+            submit(post_json, url, {'revision': {'version': 0}, 'component': build_component(item)})
+            for item in group_items
+        )
+    
+    if items:
+        print(f"        📥 Importing {len(items)} {label}(s)...")
     
-    response = requests.post(import_url, headers=headers, json=payload, verify=False, timeout=60)
-    
-    if response.status_code not in [200, 201]:
-        print(f"     ⚠️  Warning: Could not create process group '{pg_data.get('name')}': {response.status_code}")
-        print(f"        Response: {response.text[:200]}")
-        return 0
-    
-    result = response.json()
-    new_pg_id = result['id']
-    print(f"     ✅ Created process group: {pg_data.get('name')} (ID: {new_pg_id[:8]}...)")
-    
-    imported = 1
-    
-    # Import processors (directly in pg_data, not in a 'contents' object)
-    processors = pg_data.get('processors', [])
-    if processors:
-        print(f"        📥 Importing {len(processors)} processor(s)...")
-    
-    for processor in processors:
-        try:
-            proc_url = f"{NIFI_HOST}/nifi-api/process-groups/{new_pg_id}/processors"
-            
-            # Build processor payload - need to extract just the necessary fields
-            proc_component = {
-                'name': processor.get('name'),
-                'type': processor.get('type'),
-                'bundle': processor.get('bundle'),
-                'position': processor.get('position', {'x': 0, 'y': 0}),
-                'style': processor.get('style', {}),
-                'config': {
-                    'properties': processor.get('properties', {}),
-                    'schedulingPeriod': processor.get('schedulingPeriod', '0 sec'),
-                    'schedulingStrategy': processor.get('schedulingStrategy', 'TIMER_DRIVEN'),
-                    'executionNode': processor.get('executionNode', 'ALL'),
-                    'penaltyDuration': processor.get('penaltyDuration', '30 sec'),
-                    'yieldDuration': processor.get('yieldDuration', '1 sec'),
-                    'bulletinLevel': processor.get('bulletinLevel', 'WARN'),
-                    'runDurationMillis': processor.get('runDurationMillis', 0),
-                    'concurrentlySchedulableTaskCount': processor.get('concurrentlySchedulableTaskCount', 1),
-                    'autoTerminatedRelationships': processor.get('autoTerminatedRelationships', [])
-                }
-            }
-            
-            proc_payload = {
-                'revision': {'version': 0},
-                'component': proc_component
-            }
-            
-            proc_response = requests.post(proc_url, headers=headers, json=proc_payload, verify=False, timeout=60)
-            if proc_response.status_code in [200, 201]:
-                imported += 1
-                print(f"        ✅ Imported processor: {processor.get('name', 'Unknown')}")
-            else:
-                print(f"        ⚠️  Warning: Could not import processor '{processor.get('name')}': {proc_response.status_code}")
-                print(f"           Response: {proc_response.text[:300]}")
-        except Exception as e:
-            print(f"        ⚠️  Error importing processor: {e}")
-    
-    # Import connections (directly in pg_data)
-    connections = pg_data.get('connections', [])
-    if connections:
-        print(f"        📥 Importing {len(connections)} connection(s)...")
-    
-    for connection in connections:
-        try:
-            conn_url = f"{NIFI_HOST}/nifi-api/process-groups/{new_pg_id}/connections"
-            
-            conn_component = {
-                'name': connection.get('name', ''),
-                'source': connection.get('source'),
-                'destination': connection.get('destination'),
-                'selectedRelationships': connection.get('selectedRelationships', []),
-                'backPressureDataSizeThreshold': connection.get('backPressureDataSizeThreshold', '1 GB'),
-                'backPressureObjectThreshold': connection.get('backPressureObjectThreshold', 10000),
-                'flowFileExpiration': connection.get('flowFileExpiration', '0 sec'),
-                'prioritizers': connection.get('prioritizers', []),
-                'bends': connection.get('bends', [])
-            }
-            
-            conn_payload = {
-                'revision': {'version': 0},
-                'component': conn_component
-            }
-            
-            conn_response = requests.post(conn_url, headers=headers, json=conn_payload, verify=False, timeout=60)
-            if conn_response.status_code in [200, 201]:
-                imported += 1
-                print(f"        ✅ Imported connection")
-            else:
-                print(f"        ⚠️  Warning: Could not import connection: {conn_response.status_code}")
-                print(f"           Response: {conn_response.text[:200]}")
-        except Exception as e:
-            print(f"        ⚠️  Error importing connection: {e}")
-    
-    # Import input ports (directly in pg_data)
-    for port in pg_data.get('inputPorts', []):
+    imported = 0
+    for item, future in zip(items, futures):
         try:
-            port_url = f"{NIFI_HOST}/nifi-api/process-groups/{new_pg_id}/input-ports"
-            port_payload = {
-                'revision': {'version': 0},
-                'component': {
-                    'name': port.get('name'),
-                    'position': port.get('position', {'x': 0, 'y': 0})
-                }
-            }
-            
-            port_response = requests.post(port_url, headers=headers, json=port_payload, verify=False, timeout=60)
-            if port_response.status_code in [200, 201]:
-                imported += 1
-                print(f"        ✅ Imported input port: {port.get('name', 'Unknown')}")
-            else:
-                print(f"        ⚠️  Warning: Could not import input port: {port_response.status_code}")
+            response = future.result()
         except Exception as e:
-            print(f"        ⚠️  Error importing input port: {e}")
+            print(f"        ⚠️  Error importing {label}: {e}")
+            continue
+        if response.status_code in [200, 201]:
+            imported += 1
+            if VERBOSE:
+                name = f": {item.get('name', 'Unknown')}" if show_name else ''
+                print(f"        ✅ Imported {label}{name}")
+        else:
+            name = f" '{item.get('name')}'" if show_name else ''
+            print(f"        ⚠️  Warning: Could not import {label}{name}: {response.status_code}")
+            print(f"           Response: {response.text[:300]}")
+    return imported
+
+
+def import_group_contents(groups):
+    """Create every component type of COMPONENT_IMPORTS in several new process groups"""
+    imported = 0
+    for flow_key, endpoint, label, build_component, show_name in COMPONENT_IMPORTS:
+        imported += import_components(groups, flow_key, endpoint, label, build_component, show_name)
+    return imported
+
+
+def import_process_groups(parent_pg_id, process_groups):
+    """Import process groups and all their contents, level by level
     
-    # Import output ports (directly in pg_data)
-    for port in pg_data.get('outputPorts', []):
-        try:
-            port_url = f"{NIFI_HOST}/nifi-api/process-groups/{new_pg_id}/output-ports"
-            port_payload = {
-                'revision': {'version': 0},
-                'component': {
-                    'name': port.get('name'),
-                    'position': port.get('position', {'x': 0, 'y': 0})
-                }
-            }
-            
-            port_response = requests.post(port_url, headers=headers, json=port_payload, verify=False, timeout=60)
-            if port_response.status_code in [200, 201]:
-                imported += 1
-                print(f"        ✅ Imported output port: {port.get('name', 'Unknown')}")
-            else:
-                print(f"        ⚠️  Warning: Could not import output port: {port_response.status_code}")
-        except Exception as e:
-            print(f"        ⚠️  Error importing output port: {e}")
+    NOTE: NiFi backup format has components DIRECTLY in the processGroup object,
+    NOT in a nested 'contents' or 'component.contents' structure
     
-    # Import funnels (directly in pg_data)
-    for funnel in pg_data.get('funnels', []):
-        try:
-            funnel_url = f"{NIFI_HOST}/nifi-api/process-groups/{new_pg_id}/funnels"
-            funnel_payload = {
-                'revision': {'version': 0},
-                'component': {
-                    'position': funnel.get('position', {'x': 0, 'y': 0})
+    Groups of one level are created concurrently (a child needs its parent's
+    new ID), then every component type is created across the whole level
+    at once: processors, input ports, output ports, funnels, connections.
+    """
+    imported = 0
+    level = [(parent_pg_id, pg_data) for pg_data in process_groups]
+    
+    while level:
+        # Create this level's process groups
+        futures = [
+            NIFI_EXECUTOR.submit(
+                post_json,
+                f"{NIFI_API}/process-groups/{parent_id}/process-groups",
+                {
+                    'revision': {'version': 0},
+                    'component': {
+                        'name': pg_data.get('name', 'Imported Process Group'),
+                        'position': pg_data.get('position', {'x': 0, 'y': 0})
+                    }
                 }
-            }
+            )
+            for parent_id, pg_data in level
+        ]
+        
+        groups = []
+        for (parent_id, pg_data), future in zip(level, futures):
+            try:
+                response = future.result()
+            except Exception as e:
+                print(f"     ⚠️  Error importing process group '{pg_data.get('name')}': {e}")
+                continue
+            if response.status_code not in [200, 201]:
+                print(f"     ⚠️  Warning: Could not create process group '{pg_data.get('name')}': {response.status_code}")
+                print(f"        Response: {response.text[:200]}")
+                continue
             
-            funnel_response = requests.post(funnel_url, headers=headers, json=funnel_payload, verify=False, timeout=60)
-            if funnel_response.status_code in [200, 201]:
-                imported += 1
-                print(f"        ✅ Imported funnel")
-            else:
-                print(f"        ⚠️  Warning: Could not import funnel: {funnel_response.status_code}")
-        except Exception as e:
-            print(f"        ⚠️  Error importing funnel: {e}")
-    
-    # Recursively import child process groups (directly in pg_data)
-    for child_pg in pg_data.get('processGroups', []):
-        try:
-            child_imported = import_process_group_recursively(token, new_pg_id, child_pg)
-            imported += child_imported
-        except Exception as e:
-            print(f"        ⚠️  Error importing child process group: {e}")
+            new_pg_id = response.json()['id']
+            print(f"     ✅ Created process group: {pg_data.get('name')} (ID: {new_pg_id[:8]}...)")
+            groups.append((new_pg_id, pg_data))
+            imported += 1
+        
+        # Import contents of every group created at this level
+        imported += import_group_contents(groups)
+        
+        # Children are created under their parent's new ID
+        level = [
+            (new_pg_id, child_pg)
+            for new_pg_id, pg_data in groups
+            for child_pg in pg_data.get('processGroups', [])
+        ]
     
     return imported
-    """Recursively import a process group and all its contents"""
-    
-    # Create the process group
-    import_url = f"{NIFI_HOST}/nifi-api/process-groups/{parent_pg_id}/process-groups"
-    headers = {
-        'Authorization': f'Bearer {token}',
-        'Content-Type': 'application/json'
-    }
-    
-    # Get component data
-    component = pg_data.get('component', pg_data)
+
+
+def replace_flow_contents(process_group_id, flow_data):
+    """
+    Replace the process group's contents with the flow snapshot in one call.
+    flow-contents is an internal NiFi endpoint that rejects snapshots touching
+    running processors or enabled controller services, so any client error
+    other than 401/403 returns False and the caller falls back to deleting
+    and re-importing components.
+    """
+    version = get_process_group_details(process_group_id)['revision']['version']
+    snapshot = flow_data if 'flowContents' in flow_data else {'flowContents': flow_data}
     
+    url = f"{NIFI_API}/process-groups/{process_group_id}/flow-contents"
     payload = {
-        'revision': {'version': 0},
-        'component': {
-            'name': component.get('name', 'Imported Process Group'),
-            'position': component.get('position', {'x': 0, 'y': 0})
-        }
+        'processGroupRevision': {'version': version},
+        'versionedFlowSnapshot': snapshot
     }
-    
-    response = requests.post(import_url, headers=headers, json=payload, verify=False, timeout=60)
-    
-    if response.status_code not in [200, 201]:
-        print(f"     ⚠️  Warning: Could not create process group '{component.get('name')}': {response.status_code}")
-        return 0
-    
-    result = response.json()
-    new_pg_id = result['id']
-    print(f"     ✅ Created process group: {component.get('name')} (ID: {new_pg_id[:8]}...)")
-    
-    imported = 1
-    
-    # Now import contents of this process group
-    contents = pg_data.get('contents', component.get('contents', {}))
-    
-    if not contents:
-        print(f"        ℹ️  Process group is empty")
-        return imported
-    
-    # Import processors in this group
-    for processor in contents.get('processors', []):
-        try:
-            proc_url = f"{NIFI_HOST}/nifi-api/process-groups/{new_pg_id}/processors"
-            proc_component = processor.get('component', processor)
-            
-            proc_payload = {
-                'revision': {'version': 0},
-                'component': proc_component
-            }
-            
-            proc_response = requests.post(proc_url, headers=headers, json=proc_payload, verify=False, timeout=60)
-            if proc_response.status_code in [200, 201]:
-                imported += 1
-                print(f"        ✅ Imported processor: {proc_component.get('name', 'Unknown')}")
-            else:
-                print(f"        ⚠️  Warning: Could not import processor '{proc_component.get('name')}': {proc_response.status_code}")
-                print(f"           Response: {proc_response.text[:200]}")
-        except Exception as e:
-            print(f"        ⚠️  Error importing processor: {e}")
-    
-    # Import connections in this group
-    for connection in contents.get('connections', []):
-        try:
-            conn_url = f"{NIFI_HOST}/nifi-api/process-groups/{new_pg_id}/connections"
-            conn_component = connection.get('component', connection)
-            
-            conn_payload = {
-                'revision': {'version': 0},
-                'component': conn_component
-            }
-            
-            conn_response = requests.post(conn_url, headers=headers, json=conn_payload, verify=False, timeout=60)
-            if conn_response.status_code in [200, 201]:
-                imported += 1
-                print(f"        ✅ Imported connection")
-            else:
-                print(f"        ⚠️  Warning: Could not import connection: {conn_response.status_code}")
-        except Exception as e:
-            print(f"        ⚠️  Error importing connection: {e}")
-    
-    # Import input ports
-    for port in contents.get('inputPorts', []):
-        try:
-            port_url = f"{NIFI_HOST}/nifi-api/process-groups/{new_pg_id}/input-ports"
-            port_component = port.get('component', port)
-            
-            port_payload = {
-                'revision': {'version': 0},
-                'component': port_component
-            }
-            
-            port_response = requests.post(port_url, headers=headers, json=port_payload, verify=False, timeout=60)
-            if port_response.status_code in [200, 201]:
-                imported += 1
-                print(f"        ✅ Imported input port: {port_component.get('name', 'Unknown')}")
-            else:
-                print(f"        ⚠️  Warning: Could not import input port: {port_response.status_code}")
-        except Exception as e:
-            print(f"        ⚠️  Error importing input port: {e}")
-    
-    # Import output ports
-    for port in contents.get('outputPorts', []):
-        try:
-            port_url = f"{NIFI_HOST}/nifi-api/process-groups/{new_pg_id}/output-ports"
-            port_component = port.get('component', port)
-            
-            port_payload = {
-                'revision': {'version': 0},
-                'component': port_component
-            }
-            
-            port_response = requests.post(port_url, headers=headers, json=port_payload, verify=False, timeout=60)
-            if port_response.status_code in [200, 201]:
-                imported += 1
-                print(f"        ✅ Imported output port: {port_component.get('name', 'Unknown')}")
-            else:
-                print(f"        ⚠️  Warning: Could not import output port: {port_response.status_code}")
-        except Exception as e:
-            print(f"        ⚠️  Error importing output port: {e}")
-    
-    # Import funnels
-    for funnel in contents.get('funnels', []):
-        try:
-            funnel_url = f"{NIFI_HOST}/nifi-api/process-groups/{new_pg_id}/funnels"
-            funnel_component = funnel.get('component', funnel)
-            
-            funnel_payload = {
-                'revision': {'version': 0},
-                'component': funnel_component
-            }
-            
-            funnel_response = requests.post(funnel_url, headers=headers, json=funnel_payload, verify=False, timeout=60)
-            if funnel_response.status_code in [200, 201]:
-                imported += 1
-                print(f"        ✅ Imported funnel")
-            else:
-                print(f"        ⚠️  Warning: Could not import funnel: {funnel_response.status_code}")
-        except Exception as e:
-            print(f"        ⚠️  Error importing funnel: {e}")
-    
-    # Recursively import child process groups
-    for child_pg in contents.get('processGroups', []):
-        try:
-            child_imported = import_process_group_recursively(token, new_pg_id, child_pg)
-            imported += child_imported
-        except Exception as e:
-            print(f"        ⚠️  Error importing child process group: {e}")
-    
-    return imported
+    response = NIFI_SESSION.put(url, data=dump_json(payload), headers=JSON_HEADERS, timeout=300)
+    if response.ok:
+        return True
+    print(f"  ⚠️  flow-contents returned {response.status_code}")
+    print(f"     Response: {response.text[:500]}")
+    if 400 <= response.status_code < 500 and response.status_code not in [401, 403]:
+        return False
+    response.raise_for_status()
 
 
-def upload_flow_to_nifi(token, process_group_id, flow_json):
-    """Upload flow snapshot to NiFi by importing all components"""
-    
-    # Parse the flow JSON
-    try:
-        flow_data = json.loads(flow_json)
-    except json.JSONDecodeError as e:
-        raise Exception(f"Invalid flow JSON: {e}")
+def upload_flow_to_nifi(process_group_id, flow_data):
+    """Upload a parsed flow snapshot to NiFi by importing all components"""
     
     print("  📤 Uploading flow to NiFi...")
     
-    headers = {
-        'Authorization': f'Bearer {token}',
-        'Content-Type': 'application/json'
-    }
-    
     # Extract components from the flow
     flow_contents = flow_data.get('flowContents', flow_data)
     
@@ -565,95 +565,11 @@ def upload_flow_to_nifi(token, process_group_id, flow_json):
     
     # Import process groups (recursively with their contents)
     print("  📥 Importing process groups and their contents...")
-    for pg in flow_contents.get('processGroups', []):
-        try:
-            pg_imported = import_process_group_recursively(token, process_group_id, pg)
-            imported += pg_imported
-        except Exception as e:
-            print(f"     ⚠️  Error importing process group: {e}")
-    
-    # Import root-level processors
-    print("  📥 Importing root-level processors...")
-    for processor in flow_contents.get('processors', []):
-        try:
-            import_url = f"{NIFI_HOST}/nifi-api/process-groups/{process_group_id}/processors"
-            proc_component = processor.get('component', processor)
-            
-            payload = {
-                'revision': {'version': 0},
-                'component': proc_component
-            }
-            
-            response = requests.post(import_url, headers=headers, json=payload, verify=False, timeout=60)
-            if response.status_code in [200, 201]:
-                imported += 1
-                print(f"     ✅ Imported processor: {proc_component.get('name', 'Unknown')}")
-            else:
-                print(f"     ⚠️  Warning: Could not import processor: {response.status_code}")
-                print(f"        Response: {response.text[:200]}")
-        except Exception as e:
-            print(f"     ⚠️  Error importing processor: {e}")
+    imported += import_process_groups(process_group_id, flow_contents.get('processGroups', []))
     
-    # Import root-level connections
-    print("  📥 Importing root-level connections...")
-    for connection in flow_contents.get('connections', []):
-        try:
-            import_url = f"{NIFI_HOST}/nifi-api/process-groups/{process_group_id}/connections"
-            conn_component = connection.get('component', connection)
-            
-            payload = {
-                'revision': {'version': 0},
-                'component': conn_component
-            }
-            
-            response = requests.post(import_url, headers=headers, json=payload, verify=False, timeout=60)
-            if response.status_code in [200, 201]:
-                imported += 1
-                print(f"     ✅ Imported connection")
-            else:
-                print(f"     ⚠️  Warning: Could not import connection: {response.status_code}")
-        except Exception as e:
-            print(f"     ⚠️  Error importing connection: {e}")
-    
-    # Import root-level ports
-    print("  📥 Importing root-level ports...")
-    for port in flow_contents.get('inputPorts', []):
-        try:
-            import_url = f"{NIFI_HOST}/nifi-api/process-groups/{process_group_id}/input-ports"
-            port_component = port.get('component', port)
-            
-            payload = {
-                'revision': {'version': 0},
-                'component': port_component
-            }
-            
-            response = requests.post(import_url, headers=headers, json=payload, verify=False, timeout=60)
-            if response.status_code in [200, 201]:
-                imported += 1
-                print(f"     ✅ Imported input port: {port_component.get('name', 'Unknown')}")
-            else:
-                print(f"     ⚠️  Warning: Could not import input port: {response.status_code}")
-        except Exception as e:
-            print(f"     ⚠️  Error importing input port: {e}")
-    
-    for port in flow_contents.get('outputPorts', []):
-        try:
-            import_url = f"{NIFI_HOST}/nifi-api/process-groups/{process_group_id}/output-ports"
-            port_component = port.get('component', port)
-            
-            payload = {
-                'revision': {'version': 0},
-                'component': port_component
-            }
-            
-            response = requests.post(import_url, headers=headers, json=payload, verify=False, timeout=60)
-            if response.status_code in [200, 201]:
-                imported += 1
-                print(f"     ✅ Imported output port: {port_component.get('name', 'Unknown')}")
-            else:
-                print(f"     ⚠️  Warning: Could not import output port: {response.status_code}")
-        except Exception as e:
-            print(f"     ⚠️  Error importing output port: {e}")
+    # Import root-level components
+    print("  📥 Importing root-level components...")
+    imported += import_group_contents([(process_group_id, flow_contents)])
     
     print(f"  ✅ Total imported: {imported} component(s)")
     
@@ -661,175 +577,13 @@ def upload_flow_to_nifi(token, process_group_id, flow_json):
         print("  ℹ️  Note: Backup appears to be empty (no components to import)")
     
     return {'imported': imported}
-    """Upload flow snapshot to NiFi by replacing the process group content"""
-    
-    # Parse the flow JSON
-    try:
-        flow_data = json.loads(flow_json)
-    except json.JSONDecodeError as e:
-        raise Exception(f"Invalid flow JSON: {e}")
-    
-    print("  📤 Uploading flow to NiFi...")
-    
-    # Get current process group to get the version
-    pg_url = f"{NIFI_HOST}/nifi-api/process-groups/{process_group_id}"
-    headers = {'Authorization': f'Bearer {token}'}
-    
-    pg_response = requests.get(pg_url, headers=headers, verify=False, timeout=30)
-    pg_response.raise_for_status()
-    pg_data = pg_response.json()
-    
-    current_version = pg_data['revision']['version']
-    
-    # Method 1: Try to replace flow using the replace endpoint
-    # This uploads the flow contents into the root process group
-    print("  📥 Importing flow components...")
-    
-    # Extract components from the flow
-    flow_contents = flow_data.get('flowContents', flow_data)
-    
-    # Import each component type
-    imported = 0
-    
-    # Import process groups
-    for pg in flow_contents.get('processGroups', []):
-        try:
-            import_url = f"{NIFI_HOST}/nifi-api/process-groups/{process_group_id}/process-groups"
-            headers_json = {
-                'Authorization': f'Bearer {token}',
-                'Content-Type': 'application/json'
-            }
-            
-            payload = {
-                'revision': {
-                    'version': 0
-                },
-                'component': pg.get('component', pg)
-            }
-            
-            response = requests.post(import_url, headers=headers_json, json=payload, verify=False, timeout=60)
-            if response.status_code in [200, 201]:
-                imported += 1
-                print(f"     ✅ Imported process group: {pg.get('component', {}).get('name', 'Unknown')}")
-            else:
-                print(f"     ⚠️  Warning: Could not import process group: {response.status_code}")
-        except Exception as e:
-            print(f"     ⚠️  Warning: Error importing process group: {e}")
-    
-    # Import processors
-    for processor in flow_contents.get('processors', []):
-        try:
-            import_url = f"{NIFI_HOST}/nifi-api/process-groups/{process_group_id}/processors"
-            headers_json = {
-                'Authorization': f'Bearer {token}',
-                'Content-Type': 'application/json'
-            }
-            
-            payload = {
-                'revision': {
-                    'version': 0
-                },
-                'component': processor.get('component', processor)
-            }
-            
-            response = requests.post(import_url, headers=headers_json, json=payload, verify=False, timeout=60)
-            if response.status_code in [200, 201]:
-                imported += 1
-                print(f"     ✅ Imported processor: {processor.get('component', {}).get('name', 'Unknown')}")
-            else:
-                print(f"     ⚠️  Warning: Could not import processor: {response.status_code}")
-        except Exception as e:
-            print(f"     ⚠️  Warning: Error importing processor: {e}")
-    
-    # Import connections
-    for connection in flow_contents.get('connections', []):
-        try:
-            import_url = f"{NIFI_HOST}/nifi-api/process-groups/{process_group_id}/connections"
-            headers_json = {
-                'Authorization': f'Bearer {token}',
-                'Content-Type': 'application/json'
-            }
-            
-            payload = {
-                'revision': {
-                    'version': 0
-                },
-                'component': connection.get('component', connection)
-            }
-            
-            response = requests.post(import_url, headers=headers_json, json=payload, verify=False, timeout=60)
-            if response.status_code in [200, 201]:
-                imported += 1
-                print(f"     ✅ Imported connection")
-            else:
-                print(f"     ⚠️  Warning: Could not import connection: {response.status_code}")
-        except Exception as e:
-            print(f"     ⚠️  Warning: Error importing connection: {e}")
-    
-    # Import input ports
-    for port in flow_contents.get('inputPorts', []):
-        try:
-            import_url = f"{NIFI_HOST}/nifi-api/process-groups/{process_group_id}/input-ports"
-            headers_json = {
-                'Authorization': f'Bearer {token}',
-                'Content-Type': 'application/json'
-            }
-            
-            payload = {
-                'revision': {
-                    'version': 0
-                },
-                'component': port.get('component', port)
-            }
-            
-            response = requests.post(import_url, headers=headers_json, json=payload, verify=False, timeout=60)
-            if response.status_code in [200, 201]:
-                imported += 1
-                print(f"     ✅ Imported input port: {port.get('component', {}).get('name', 'Unknown')}")
-            else:
-                print(f"     ⚠️  Warning: Could not import input port: {response.status_code}")
-        except Exception as e:
-            print(f"     ⚠️  Warning: Error importing input port: {e}")
-    
-    # Import output ports
-    for port in flow_contents.get('outputPorts', []):
-        try:
-            import_url = f"{NIFI_HOST}/nifi-api/process-groups/{process_group_id}/output-ports"
-            headers_json = {
-                'Authorization': f'Bearer {token}',
-                'Content-Type': 'application/json'
-            }
-            
-            payload = {
-                'revision': {
-                    'version': 0
-                },
-                'component': port.get('component', port)
-            }
-            
-            response = requests.post(import_url, headers=headers_json, json=payload, verify=False, timeout=60)
-            if response.status_code in [200, 201]:
-                imported += 1
-                print(f"     ✅ Imported output port: {port.get('component', {}).get('name', 'Unknown')}")
-            else:
-                print(f"     ⚠️  Warning: Could not import output port: {response.status_code}")
-        except Exception as e:
-            print(f"     ⚠️  Warning: Error importing output port: {e}")
-    
-    print(f"  ✅ Imported {imported} component(s)")
-    
-    if imported == 0:
-        print("  ℹ️  Note: Backup appears to be empty (no components to import)")
-    
-    return {'imported': imported}
 
 
-def backup_current_flow(token, process_group_id):
+def backup_current_flow(process_group_id):
     """Create a backup of current flow before rollback"""
-    url = f"{NIFI_HOST}/nifi-api/process-groups/{process_group_id}/download"
-    headers = {'Authorization': f'Bearer {token}'}
+    url = f"{NIFI_API}/process-groups/{process_group_id}/download"
     
-    response = requests.get(url, headers=headers, verify=False, timeout=120)
+    response = NIFI_SESSION.get(url, timeout=120)
     response.raise_for_status()
     
     timestamp = datetime.utcnow().strftime('%Y%m%d-%H%M%S')
@@ -842,62 +596,146 @@ def backup_current_flow(token, process_group_id):
     return backup_file
 
 
+def get_folder_sha(repo, folder):
+    """Tree SHA of a folder on the backup branch (one listing of its parent), or None"""
+    parent, _, name = folder.rstrip('/').rpartition('/')
+    for entry in repo.get_contents(parent, ref=BACKUP_BRANCH):
+        if entry.name == name and entry.type == 'dir':
+            return entry.sha
+    return None
+
+
 def list_available_backups(repo, backup_folder):
-    """List all available backups"""
+    """
+    List all available backups. Only the backup folder's subtree is fetched,
+    and not at all when its SHA matches the cached listing.
+    """
     try:
-        contents = repo.get_contents(backup_folder, ref=BACKUP_BRANCH)
-        date_folders = [item for item in contents if item.type == "dir"]
+        folder_sha = get_folder_sha(repo, backup_folder)
+        if folder_sha is None:
+            return []
+        
+        try:
+            with open(BACKUP_LIST_CACHE_FILE, 'rb') as f:
+                cache = load_json(f)
+            if cache.get('folder') == backup_folder and cache.get('sha') == folder_sha:
+                return cache['backups']
+        except (OSError, ValueError, KeyError):
+            pass
+        
+        tree = repo.get_git_tree(folder_sha, recursive=True)
         
+        # Subtree paths are relative to the backup folder: <date>/<time>
         backups = []
-        for date_folder in date_folders:
-            time_contents = repo.get_contents(date_folder.path, ref=BACKUP_BRANCH)
-            time_folders = [item for item in time_contents if item.type == "dir"]
-            
-            for time_folder in time_folders:
+        for entry in tree.tree:
+            if entry.type != 'tree':
+                continue
+            date, _, time_folder = entry.path.partition('/')
+            if time_folder and '/' not in time_folder:
                 backups.append({
-                    'date': date_folder.name,
-                    'time': time_folder.name,
-                    'path': time_folder.path
+                    'date': date,
+                    'time': time_folder,
+                    'path': f"{backup_folder}/{entry.path}"
                 })
         
-        return sorted(backups, key=lambda x: (x['date'], x['time']), reverse=True)
+        backups.sort(key=lambda x: (x['date'], x['time']), reverse=True)
+        
+        try:
+            os.makedirs(os.path.dirname(BACKUP_LIST_CACHE_FILE) or '.', exist_ok=True)
+            with open(BACKUP_LIST_CACHE_FILE, 'wb') as f:
+                f.write(dump_json({'folder': backup_folder, 'sha': folder_sha, 'backups': backups}))
+        except OSError:
+            pass
+        return backups
     except Exception as e:
         return []
 
 
-def download_backup(repo, backup_path):
+def download_backup_file(file_path, cache=False):
+    """
+    Download a file from the backup branch as raw bytes, or None if it does
+    not exist. With cache, the file is revalidated against a local copy in
+    GITHUB_CACHE_DIR by ETag instead of being downloaded again.
+    """
+    url = f"{GITHUB_API_URL}/repos/{GITHUB_REPO}/contents/{file_path}"
+    headers = {}
+    if cache:
+        cache_key = hashlib.sha256(f"{url}@{BACKUP_BRANCH}".encode('utf-8')).hexdigest()
+        cache_path = os.path.join(GITHUB_CACHE_DIR, cache_key)
+        if os.path.exists(cache_path + '.bin'):
+            try:
+                with open(cache_path + '.etag') as f:
+                    headers['If-None-Match'] = f.read()
+            except OSError:
+                pass
+    
+    response = GITHUB_SESSION.get(url, params={'ref': BACKUP_BRANCH}, headers=headers, timeout=120)
+    if response.status_code == 304:
+        print(f"  ℹ️  {file_path} unchanged, using cached copy")
+        with open(cache_path + '.bin', 'rb') as f:
+            return f.read()
+    if response.status_code == 404:
+        return None
+    response.raise_for_status()
+    
+    etag = response.headers.get('ETag')
+    if cache and etag:
+        try:
+            os.makedirs(GITHUB_CACHE_DIR, exist_ok=True)
+            with open(cache_path + '.bin', 'wb') as f:
+                f.write(response.content)
+            with open(cache_path + '.etag', 'w') as f:
+                f.write(etag)
+        except OSError as e:
+            print(f"  ⚠️  Could not cache {file_path}: {e}")
+    return response.content
+
+
+def download_metadata(backup_path):
+    """Fetch backup metadata: metadata.json.gz, or metadata.json for older backups"""
+    metadata_content = download_backup_file(f"{backup_path}/metadata.json.gz")
+    if metadata_content is not None:
+        return json.loads(gzip.decompress(metadata_content))
+    metadata_content = download_backup_file(f"{backup_path}/metadata.json")
+    if metadata_content is None:
+        raise Exception(f"No metadata found in {backup_path}")
+    return json.loads(metadata_content)
+
+
+def download_backup(backup_path):
     """Download backup files from GitHub"""
     try:
         # Get flow.json.gz
-        flow_file = repo.get_contents(f"{backup_path}/flow.json.gz", ref=BACKUP_BRANCH)
-        flow_content = flow_file.decoded_content
+        flow_content = download_backup_file(f"{backup_path}/flow.json.gz", cache=True)
+        if flow_content is None:
+            raise Exception(f"flow.json.gz not found in {backup_path}")
         
-        # Get metadata.json
-        metadata_file = repo.get_contents(f"{backup_path}/metadata.json", ref=BACKUP_BRANCH)
-        metadata_content = metadata_file.decoded_content
-        metadata = json.loads(metadata_content)
+        # Get metadata
+        metadata = download_metadata(backup_path)
         
-        # Try to decompress flow - handle both gzipped and plain JSON
-        try:
-            flow_json = gzip.decompress(flow_content)
+        # Handle both gzipped and plain JSON; decompression and parsing
+        # happen in one pass so no separate decompressed copy is kept
+        stream = io.BytesIO(flow_content)
+        if flow_content[:2] == GZIP_MAGIC:
+            stream = gzip.GzipFile(fileobj=stream)
             print(f"  ℹ️  File was gzip compressed")
-        except gzip.BadGzipFile:
-            # File is not gzipped, use as-is
-            flow_json = flow_content
+        else:
             print(f"  ℹ️  File is plain JSON (not compressed)")
         
-        # Validate it's valid JSON
+        # Parsing doubles as validation
         try:
-            json.loads(flow_json)
-        except json.JSONDecodeError as e:
+            flow_data = load_json(stream)
+        except (json.JSONDecodeError, gzip.BadGzipFile, EOFError) as e:
             raise Exception(f"Downloaded file is not valid JSON: {e}")
         
-        return flow_json, metadata
+        return flow_data, len(flow_content), metadata
     except Exception as e:
         raise Exception(f"Failed to download backup: {e}")
 
 
 def main():
+    global VERBOSE
+    
     print("=" * 60)
     print("    NiFi Automated Rollback Script")
     print("=" * 60)
@@ -911,7 +749,11 @@ def main():
                        help='Skip stopping processors (dangerous!)')
     parser.add_argument('--skip-backup', action='store_true',
                        help='Skip creating pre-rollback backup')
+    parser.add_argument('--verbose', action='store_true',
+                       help='Print a line for every stopped/deleted/imported component')
     args = parser.parse_args()
+    if args.verbose:
+        VERBOSE = True
     
     # Validate GitHub variables
     github_vars = {
@@ -1008,8 +850,8 @@ def main():
         print(f"Step 2: Downloading backup from {BACKUP_DATE} {BACKUP_TIME}...")
         print(f"  📁 Backup path: {backup_path}")
         
-        flow_json, metadata = download_backup(repo, backup_path)
-        print(f"  ✅ Downloaded backup ({len(flow_json):,} bytes)")
+        flow_data, download_size, metadata = download_backup(backup_path)
+        print(f"  ✅ Downloaded backup ({download_size:,} bytes)")
         print(f"  📊 Backup metadata:")
         print(f"     - Timestamp: {metadata.get('backup_timestamp', 'N/A')}")
         print(f"     - Processors: {metadata.get('statistics', {}).get('processors', 0)}")
@@ -1018,29 +860,35 @@ def main():
         
         # Step 4: Authenticate with NiFi
         print("Step 3: Authenticating with NiFi...")
-        token = get_nifi_token()
+        get_nifi_token()
         print("  ✅ Authentication successful")
         print("")
         
         # Step 5: Get root process group
         print("Step 4: Getting root process group...")
-        root_pg_id = get_root_process_group_id(token)
+        root_pg_id = get_root_process_group_id()
         print(f"  ✅ Root PG ID: {root_pg_id}")
         print("")
         
         # Step 6: Create pre-rollback backup
         if CREATE_PRE_BACKUP and not args.skip_backup:
             print("Step 5: Creating pre-rollback backup...")
-            backup_file = backup_current_flow(token, root_pg_id)
+            backup_file = backup_current_flow(root_pg_id)
             print("")
         
         # Step 7: Stop processors
+        # The flow tree fetched here is reused for deletion when nothing can
+        # change in between (no manual confirmation)
+        flow_tree = None
         if STOP_PROCESSORS and not args.skip_stop:
             print("Step 6: Stopping all processors...")
-            stopped_count = stop_all_processors(token, root_pg_id)
+            flow_tree = get_flow_tree(root_pg_id)
+            stopped_count = stop_all_processors(root_pg_id, flow_tree)
             print(f"  ✅ Stopped {stopped_count} processor(s)")
-            print("  ⏳ Waiting 5 seconds for processors to stop...")
-            time.sleep(5)
+            print("  ⏳ Waiting for processors to stop...")
+            active_threads = wait_for_processors_to_stop(root_pg_id)
+            if active_threads:
+                print(f"  ⚠️  {active_threads} thread(s) still active after {STOP_WAIT_TIMEOUT}s, continuing")
             print("")
         
         # Step 8: Confirmation
@@ -1071,24 +919,31 @@ def main():
         
         print("")
         
-        # Step 9: Delete existing components
-        print("Step 7: Deleting existing flow...")
-        delete_all_components(token, root_pg_id)
-        print("")
-        
-        # Step 10: Upload new flow
-        print("Step 8: Uploading backup to NiFi...")
-        result = upload_flow_to_nifi(token, root_pg_id, flow_json)
-        print("")
+        # Step 9: Replace existing flow (one call, or delete and re-import)
+        print("Step 7: Replacing flow contents...")
+        if replace_flow_contents(root_pg_id, flow_data):
+            print("  ✅ Flow replaced in a single call")
+            print("")
+        else:
+            print("  ℹ️  flow-contents endpoint not usable, replacing component by component")
+            print("")
+            print("Step 7: Deleting existing flow...")
+            delete_all_components(root_pg_id, flow_tree if AUTO_CONFIRM else None)
+            print("")
+            
+            # Step 10: Upload new flow
+            print("Step 8: Uploading backup to NiFi...")
+            upload_flow_to_nifi(root_pg_id, flow_data)
+            print("")
         
         # Save artifacts
         output_file = f"/tmp/nifi-rollback-{BACKUP_DATE}-{BACKUP_TIME}.json"
         with open(output_file, 'wb') as f:
-            f.write(flow_json)
+            f.write(dump_json(flow_data))
         
         metadata_output = "/tmp/rollback-metadata.json"
         with open(metadata_output, 'w') as f:
-            json.dump({
+            f.write(json.dumps({
                 'backup_date': BACKUP_DATE,
                 'backup_time': BACKUP_TIME,
                 'backup_path': backup_path,
@@ -1097,7 +952,7 @@ def main():
                 'rolled_back_at': datetime.utcnow().isoformat() + 'Z',
                 'backup_metadata': metadata,
                 'automated': True
-            }, f, indent=2)
+            }, indent=2))
         
         print("=" * 60)
         print("✅ ROLLBACK COMPLETED SUCCESSFULLY")
@@ -4,33 +4,92 @@ Script to scan JARs folder, compare with existing Dockerfile entries,
 and create a PR to add new JAR download commands.
 """
 
+import io
 import os
 import re
 import json
-from pathlib import Path
+import time
+import base64
+import requests
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor
+from urllib3.util.retry import Retry
 from github import Github, Auth
-from datetime import datetime
+
+# orjson is optional: parses manifest bytes directly and faster,
+# stdlib json (which also accepts bytes) is used when it isn't installed
+try:
+    import orjson
+    
+    json_loads = orjson.loads
+    
+    def dump_report_json(obj):
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2)
+except ImportError:
+    json_loads = json.loads
+    
+    def dump_report_json(obj):
+        return json.dumps(obj, indent=2).encode('utf-8')
+
+
+# Pattern to match curl commands downloading JARs
+# Matches: RUN curl -L "url" \
+#              -o /path/to/jar.jar
+# Only follows backslash line continuations, so a match never spills
+# into the next RUN instruction. Bytes pattern, so it scans the raw
+# Dockerfile content without decoding it first.
+CURL_JAR_PATTERN = re.compile(
+    rb'curl\s+-L\s+"([^"]+)"(?:[^\n]*\\\n)*?[^\n]*?-o\s+([^\s\\]+\.jar)'
+)
+
+# Insertion points for new JAR blocks, in order of preference
+MARKER_PATTERN = re.compile(r'(# =+\n# NEW JARS WILL BE ADDED AUTOMATICALLY ABOVE THIS LINE)')
+USER_BLOCK_PATTERN = re.compile(r'(# Revert to NiFi user.*?\nUSER 1000)', re.DOTALL)
+
+# Install location used when a manifest doesn't set install_path
+DEFAULT_INSTALL_PATH = '/opt/nifi/nifi-current/lib/'
+
+# Bounded retries on transient gateway errors instead of PyGithub's default
+# of up to 10 attempts
+GITHUB_RETRY = Retry(total=3, backoff_factor=0.5, status_forcelist=[502, 503, 504])
+
+# Same policy for the GraphQL commit, with POST allowed: expectedHeadOid makes
+# a repeated createCommitOnBranch fail instead of committing twice
+GITHUB_GRAPHQL_RETRY = GITHUB_RETRY.new(allowed_methods=None)
+
+GITHUB_GRAPHQL_URL = os.environ.get('GITHUB_GRAPHQL_URL', 'https://api.github.com/graphql')
+
+# Creates or updates files on a branch in one call, without first looking
+# up each file's blob SHA
+CREATE_COMMIT_MUTATION = """
+mutation($input: CreateCommitOnBranchInput!) {
+  createCommitOnBranch(input: $input) {
+    commit { oid }
+  }
+}
+"""
+
+
+def read_dockerfile(dockerfile_path: str) -> bytes:
+    """
+    Read the Dockerfile once; both the JAR scan and the update work on
+    these bytes.
+    """
+    with open(dockerfile_path, 'rb') as f:
+        return f.read()
 
 
-def parse_dockerfile_jars(dockerfile_path: str) -> dict:
+def parse_dockerfile_jars(content: bytes) -> dict:
     """
-    Parse existing JAR downloads from Dockerfile.
+    Parse existing JAR downloads from Dockerfile content.
     Returns dict with jar_name -> download_url mapping.
     """
     existing_jars = {}
-    
-    with open(dockerfile_path, 'r') as f:
-        content = f.read()
-    
-    # Pattern to match curl commands downloading JARs
-    # Matches: RUN curl -L "url" -o /path/to/jar.jar
-    pattern = r'curl\s+-L\s+"([^"]+)"\s+.*?-o\s+([^\s\\]+\.jar)'
-    
-    matches = re.findall(pattern, content, re.MULTILINE | re.DOTALL)
-    
-    for url, jar_path in matches:
-        jar_name = os.path.basename(jar_path)
-        existing_jars[jar_name] = {
+    # Only the captured groups are decoded
+    for match in CURL_JAR_PATTERN.finditer(content):
+        url = match.group(1).decode('utf-8')
+        jar_path = match.group(2).decode('utf-8')
+        existing_jars[jar_path.rpartition('/')[2]] = {
             'url': url,
             'path': jar_path
         }
@@ -38,6 +97,31 @@ def parse_dockerfile_jars(dockerfile_path: str) -> dict:
     return existing_jars
 
 
+def load_manifest(manifest_file: str):
+    """
+    Load a single JAR manifest file.
+    Returns (jar_name, jar_info) tuple, or None if the manifest is invalid.
+    """
+    try:
+        with open(manifest_file, 'rb') as f:
+            manifest = json_loads(f.read())
+    except json.JSONDecodeError as e:
+        print(f"Error parsing {manifest_file}: {e}")
+        return None
+    
+    get = manifest.get
+    jar_name = get('name')
+    if not jar_name:
+        return None
+    
+    return jar_name, {
+        'url': get('url'),
+        'install_path': get('install_path', DEFAULT_INSTALL_PATH),
+        'description': get('description', ''),
+        'manifest_file': manifest_file
+    }
+
+
 def scan_jars_folder(jars_folder: str) -> dict:
     """
     Scan the JARs folder for JAR manifest files.
@@ -52,27 +136,26 @@ def scan_jars_folder(jars_folder: str) -> dict:
     }
     """
     requested_jars = {}
-    jars_path = Path(jars_folder)
-    
-    if not jars_path.exists():
+    if not os.path.exists(jars_folder):
         print(f"JARs folder not found: {jars_folder}")
         return requested_jars
     
-    for manifest_file in jars_path.glob("*.json"):
-        try:
-            with open(manifest_file, 'r') as f:
-                manifest = json.load(f)
-            
-            jar_name = manifest.get('name')
-            if jar_name:
-                requested_jars[jar_name] = {
-                    'url': manifest.get('url'),
-                    'install_path': manifest.get('install_path', '/opt/nifi/nifi-current/lib/'),
-                    'description': manifest.get('description', ''),
-                    'manifest_file': str(manifest_file)
-                }
-        except json.JSONDecodeError as e:
-            print(f"Error parsing {manifest_file}: {e}")
+    # scandir entries carry the path string and cached file type, so the
+    # listing needs no per-file stat or Path objects
+    with os.scandir(jars_folder) as entries:
+        manifest_files = [
+            entry.path for entry in entries
+            if entry.name.endswith('.json') and not entry.name.startswith('.') and entry.is_file()
+        ]
+    
+    # Manifests are independent, so overlap the file reads
+    with ThreadPoolExecutor(max_workers=min(32, len(manifest_files) or 1)) as executor:
+        results = executor.map(load_manifest, manifest_files)
+    
+    for result in results:
+        if result:
+            jar_name, jar_info = result
+            requested_jars[jar_name] = jar_info
     
     return requested_jars
 
@@ -84,13 +167,17 @@ def find_new_jars(existing_jars: dict, requested_jars: dict) -> dict:
     """
     new_jars = {}
     
+    # One lookup per requested JAR; iteration keeps manifest order, which
+    # sets the order of the Dockerfile additions and the PR title
+    get_existing = existing_jars.get
     for jar_name, jar_info in requested_jars.items():
-        if jar_name not in existing_jars:
+        existing = get_existing(jar_name)
+        if existing is None:
             new_jars[jar_name] = jar_info
-        elif existing_jars[jar_name]['url'] != jar_info['url']:
+        elif existing['url'] != jar_info['url']:
             # JAR exists but URL is different (version update)
             jar_info['is_update'] = True
-            jar_info['old_url'] = existing_jars[jar_name]['url']
+            jar_info['old_url'] = existing['url']
             new_jars[jar_name] = jar_info
     
     return new_jars
@@ -100,68 +187,107 @@ def generate_dockerfile_additions(new_jars: dict) -> str:
     """
     Generate Dockerfile RUN commands for new JARs.
     """
-    additions = []
+    # Write straight into one buffer instead of formatting and joining
+    # a string per JAR
+    buf = io.StringIO()
+    write = buf.write
     
-    for jar_name, jar_info in new_jars.items():
+    for index, (jar_name, jar_info) in enumerate(new_jars.items()):
         url = jar_info['url']
         install_path = jar_info['install_path'].rstrip('/')
         description = jar_info.get('description', jar_name)
         full_path = f"{install_path}/{jar_name}"
         
-        addition = f"""
-# Download {description}
-RUN curl -L "{url}" \\
-        -o {full_path} && \\
-        chown 1000:1000 {full_path}
-"""
-        additions.append(addition)
-    
-    return '\n'.join(additions)
+        if index:
+            write('\n')
+        write('\n# Download ')
+        write(description)
+        write('\nRUN curl -L "')
+        write(url)
+        write('" \\\n        -o ')
+        write(full_path)
+        write(' && \\\n        chown 1000:1000 ')
+        write(full_path)
+        write('\n')
+    
+    return buf.getvalue()
 
 
-def update_dockerfile_content(dockerfile_path: str, new_jars: dict) -> str:
+def update_dockerfile_content(dockerfile_content: bytes, new_jars: dict) -> str:
     """
     Generate updated Dockerfile content with new JAR downloads.
     Inserts new JARs before the marker comment or USER 1000 line.
     """
-    with open(dockerfile_path, 'r') as f:
-        content = f.read()
+    content = dockerfile_content.decode('utf-8')
     
     additions = generate_dockerfile_additions(new_jars)
     
-    # First try: Look for the marker comment
-    marker_pattern = r'(# =+\n# NEW JARS WILL BE ADDED AUTOMATICALLY ABOVE THIS LINE)'
-    
-    if re.search(marker_pattern, content):
-        updated_content = re.sub(
-            marker_pattern,
-            f"{additions}\n\\1",
-            content
-        )
-    # Second try: Find the line "USER 1000" and insert before it
-    elif re.search(r'(# Revert to NiFi user.*?\nUSER 1000)', content, re.DOTALL):
-        user_pattern = r'(# Revert to NiFi user.*?\nUSER 1000)'
-        updated_content = re.sub(
-            user_pattern,
-            f"{additions}\n\\1",
-            content,
-            flags=re.DOTALL
-        )
-    else:
-        # Fallback: append before USER 1000 line
-        lines = content.split('\n')
-        insert_index = len(lines) - 1
-        for i, line in enumerate(lines):
-            if 'USER 1000' in line:
-                insert_index = i
-                break
-        
-        lines.insert(insert_index, additions)
-        updated_content = '\n'.join(lines)
+    # First try: insert above the marker comment; second try: above the
+    # "Revert to NiFi user" block ending in USER 1000. subn reports whether
+    # a pattern matched, so each is scanned only once.
+    replacement = f"{additions}\n\\1"
+    updated_content, count = MARKER_PATTERN.subn(replacement, content, count=1)
+    if not count:
+        updated_content, count = USER_BLOCK_PATTERN.subn(replacement, content, count=1)
+    if not count:
+        # Fallback: insert before the first line containing USER 1000,
+        # or before the last line if there is none
+        user_index = content.find('USER 1000')
+        if user_index == -1:
+            line_start = content.rfind('\n') + 1
+        else:
+            line_start = content.rfind('\n', 0, user_index) + 1
+        updated_content = f"{content[:line_start]}{additions}\n{content[line_start:]}"
     
     return updated_content
 
 
+def commit_files_to_branch(
+    github_token: str,
+    repo_full_name: str,
+    branch_name: str,
+    head_sha: str,
+    files: dict,
+    message: str
+) -> str:
+    """
+    Commit files (path -> content, created or replaced) on top of head_sha
+    as a single commit. Returns the new commit SHA.
+    """
+    variables = {
+        'input': {
+            'branch': {
+                'repositoryNameWithOwner': repo_full_name,
+                'branchName': branch_name
+            },
+            'message': {'headline': message},
+            'expectedHeadOid': head_sha,
+            'fileChanges': {
+                'additions': [
+                    {
+                        'path': file_path,
+                        'contents': base64.b64encode(content.encode('utf-8')).decode('ascii')
+                    }
+                    for file_path, content in files.items()
+                ]
+            }
+        }
+    }
+    with requests.Session() as session:
+        session.mount('https://', HTTPAdapter(max_retries=GITHUB_GRAPHQL_RETRY))
+        response = session.post(
+            GITHUB_GRAPHQL_URL,
+            json={'query': CREATE_COMMIT_MUTATION, 'variables': variables},
+            headers={'Authorization': f'bearer {github_token}'},
+            timeout=60
+        )
+    response.raise_for_status()
+    result = response.json()
+    if result.get('errors'):
+        raise Exception(f"createCommitOnBranch failed: {result['errors']}")
+    return result['data']['createCommitOnBranch']['commit']['oid']
+
+
 def create_github_pr(
     new_jars: dict,
     updated_dockerfile: str,
@@ -189,14 +315,17 @@ def create_github_pr(
 
     # Use new Auth.Token() method to avoid deprecation warning
     auth = Auth.Token(github_token)
-    g = Github(auth=auth)
+    g = Github(auth=auth, per_page=100, retry=GITHUB_RETRY, lazy=True)
 
     # Try to get the repo with better error handling
     repo_full_name = f"{repo_owner}/{repo_name}"
     print(f"Attempting to access repository: {repo_full_name}")
 
+    # The client is lazy: fetching the base branch is the first call and
+    # doubles as the access check, saving a separate get_repo round trip
+    repo = g.get_repo(repo_full_name)
     try:
-        repo = g.get_repo(repo_full_name)
+        base_sha = repo.get_branch(target_branch).commit.sha
         print(f"Successfully accessed repository: {repo_full_name}")
     except Exception as e:
         print(f"ERROR: Failed to access repository '{repo_full_name}'")
@@ -205,53 +334,43 @@ def create_github_pr(
         print("1. Repository name is incorrect")
         print("2. GitHub token doesn't have access to this repository")
         print("3. GitHub token needs 'repo' scope")
+        print(f"4. Target branch '{target_branch}' doesn't exist")
         print(f"\nVerify the repository exists: https://github.com/{repo_full_name}")
         raise
     
     # Create branch name
-    timestamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+    timestamp = time.strftime("%Y%m%d-%H%M%S")
     jar_names = list(new_jars.keys())
     branch_name = f"auto/add-jars-{timestamp}"
     
-    # Get the base branch
-    base_branch = repo.get_branch(target_branch)
-    base_sha = base_branch.commit.sha
-    
     # Create new branch
     repo.create_git_ref(
         ref=f"refs/heads/{branch_name}",
         sha=base_sha
     )
     
-    # Get current file to get its SHA
-    try:
-        current_file = repo.get_contents(dockerfile_path, ref=target_branch)
-        file_sha = current_file.sha
-    except Exception:
-        file_sha = None
-    
-    # Create/Update file in new branch
+    # Commit the Dockerfile to the new branch (creates or updates it)
     commit_message = f"Add new JAR(s): {', '.join(jar_names)} [skip ci]"
-    
-    if file_sha:
-        repo.update_file(
-            path=dockerfile_path,
-            message=commit_message,
-            content=updated_dockerfile,
-            sha=file_sha,
-            branch=branch_name
-        )
-    else:
-        repo.create_file(
-            path=dockerfile_path,
-            message=commit_message,
-            content=updated_dockerfile,
-            branch=branch_name
-        )
+    commit_files_to_branch(
+        github_token,
+        repo_full_name,
+        branch_name,
+        base_sha,
+        {dockerfile_path: updated_dockerfile},
+        commit_message
+    )
     
     # Create PR
     pr_title = f"[Auto] Add JAR(s): {', '.join(jar_names)} [skip ci]"
     
+    rows = []
+    for jar_name, jar_info in new_jars.items():
+        description = jar_info.get('description', 'N/A')
+        url = jar_info.get('url', 'N/A')
+        is_update = jar_info.get('is_update', False)
+        status = "🔄 UPDATE" if is_update else "✨ NEW"
+        rows.append(f"| {jar_name} | {description} ({status}) | [Link]({url}) |\n")
+    
     pr_body = f"""## Automated JAR Addition
 
 This PR was automatically generated by the CI pipeline.
@@ -260,16 +379,7 @@ This PR was automatically generated by the CI pipeline.
 
 | JAR Name | Description | URL |
 |----------|-------------|-----|
-"""
-    
-    for jar_name, jar_info in new_jars.items():
-        description = jar_info.get('description', 'N/A')
-        url = jar_info.get('url', 'N/A')
-        is_update = jar_info.get('is_update', False)
-        status = "🔄 UPDATE" if is_update else "✨ NEW"
-        pr_body += f"| {jar_name} | {description} ({status}) | [Link]({url}) |\n"
-    
-    pr_body += """
+{''.join(rows)}
 ### Checklist
 - [ ] JAR URL is valid and accessible
 - [ ] JAR is compatible with NiFi version
@@ -304,7 +414,7 @@ def save_diff_report(existing_jars: dict, requested_jars: dict, new_jars: dict):
     Save a JSON report of the JAR diff.
     """
     report = {
-        'timestamp': datetime.now().isoformat(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
         'existing_jars': list(existing_jars.keys()),
         'requested_jars': list(requested_jars.keys()),
         'new_jars': {
@@ -319,8 +429,8 @@ def save_diff_report(existing_jars: dict, requested_jars: dict, new_jars: dict):
     }
     
     report_path = '/tmp/jar-diff-report.json'
-    with open(report_path, 'w') as f:
-        json.dump(report, f, indent=2)
+    with open(report_path, 'wb') as f:
+        f.write(dump_report_json(report))
     
     print(f"Diff report saved to {report_path}")
     return report
@@ -336,7 +446,8 @@ def main():
     print(f"Scanning JARs folder: {jars_folder}")
     
     # Parse existing JARs from Dockerfile
-    existing_jars = parse_dockerfile_jars(dockerfile_path)
+    dockerfile_content = read_dockerfile(dockerfile_path)
+    existing_jars = parse_dockerfile_jars(dockerfile_content)
     print(f"Found {len(existing_jars)} existing JARs in Dockerfile")
     for jar_name in existing_jars:
         print(f"  - {jar_name}")
@@ -359,7 +470,7 @@ def main():
         return
     
     # Generate updated Dockerfile
-    updated_dockerfile = update_dockerfile_content(dockerfile_path, new_jars)
+    updated_dockerfile = update_dockerfile_content(dockerfile_content, new_jars)
     
     # Create GitHub PR
     try:
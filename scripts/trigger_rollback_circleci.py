@@ -6,12 +6,28 @@ Usage: python trigger_rollback_circleci.py [--list] [--date YYYY-MM-DD] [--time
 """
 
 import os
+import re
 import sys
 import json
+import time
 import argparse
-import requests
+from dataclasses import dataclass
 from datetime import datetime
 
+# orjson is optional: it encodes the pipeline payload and decodes API
+# responses straight from bytes, the stdlib codec is used when it isn't
+# installed. orjson.JSONDecodeError subclasses ValueError.
+try:
+    import orjson
+    
+    json_loads = orjson.loads
+    json_dumps = orjson.dumps
+except ImportError:
+    json_loads = json.loads
+    
+    def json_dumps(obj):
+        return json.dumps(obj).encode('utf-8')
+
 
 # Configuration
 CIRCLECI_TOKEN = os.environ.get('CIRCLECI_TOKEN')
@@ -20,23 +36,64 @@ REPO_NAME = os.environ.get('REPO_NAME', 'nifi-jar-automation-option2')
 BRANCH = os.environ.get('BRANCH', 'main')
 
 
+@dataclass(frozen=True, slots=True)
+class Config:
+    """Repository and branch a pipeline is triggered for"""
+    repo_owner: str
+    repo_name: str
+    branch: str
+
+# Shared CircleCI session: the workflow lookup reuses the pipeline trigger's
+# connection. Created by get_circleci_session() on first use, so --help and
+# argument errors don't pay for importing requests.
+CIRCLECI_SESSION = None
+
+# Seconds to wait before each workflow lookup: CircleCI creates a pipeline's
+# workflows shortly after the trigger returns, so an empty list is retried
+# a couple of times before giving up
+WORKFLOW_POLL_DELAYS = (0, 1, 2)
+
+WORKFLOW_STATUS_ICONS = {
+    'running': '🔄',
+    'success': '✅',
+    'failed': '❌',
+    'on_hold': '⏸️',
+    'canceled': '⛔',
+    'not_run': '⏭️'
+}
+
+# Characters of a non-JSON error body to print
+ERROR_BODY_LIMIT = 2048
+
+# Backup folders are named YYYY-MM-DD/HH-MM-JST (zero-padded)
+DATE_PATTERN = re.compile(r'(\d{4})-(0[1-9]|1[0-2])-(0[1-9]|[12]\d|3[01])')
+TIME_PATTERN = re.compile(r'([01]\d|2[0-3])-[0-5]\d-(JST|UTC)')
+
+
+# Color only when writing to a terminal; CI logs and pipes get plain text
+USE_COLOR = sys.stdout.isatty()
+
+
 class Colors:
     """ANSI color codes for terminal output"""
-    RED = '\033[0;31m'
-    GREEN = '\033[0;32m'
-    YELLOW = '\033[1;33m'
-    BLUE = '\033[0;34m'
-    CYAN = '\033[0;36m'
-    MAGENTA = '\033[0;35m'
-    BOLD = '\033[1m'
-    NC = '\033[0m'  # No Color
+    RED = '\033[0;31m' if USE_COLOR else ''
+    GREEN = '\033[0;32m' if USE_COLOR else ''
+    YELLOW = '\033[1;33m' if USE_COLOR else ''
+    BLUE = '\033[0;34m' if USE_COLOR else ''
+    CYAN = '\033[0;36m' if USE_COLOR else ''
+    MAGENTA = '\033[0;35m' if USE_COLOR else ''
+    BOLD = '\033[1m' if USE_COLOR else ''
+    NC = '\033[0m' if USE_COLOR else ''  # No Color
+
+
+# Rules reused by every header and section
+HEADER_BAR = f"{Colors.BLUE}{Colors.BOLD}{'=' * 70}{Colors.NC}"
+SECTION_RULE = f"{Colors.CYAN}{'─' * 70}{Colors.NC}"
 
 
 def print_header(text):
     """Print formatted header"""
-    print(f"\n{Colors.BLUE}{Colors.BOLD}{'=' * 70}{Colors.NC}")
-    print(f"{Colors.BLUE}{Colors.BOLD}{text:^70}{Colors.NC}")
-    print(f"{Colors.BLUE}{Colors.BOLD}{'=' * 70}{Colors.NC}\n")
+    print(f"\n{HEADER_BAR}\n{Colors.BLUE}{Colors.BOLD}{text:^70}{Colors.NC}\n{HEADER_BAR}\n")
 
 
 def print_success(text):
@@ -59,6 +116,29 @@ def print_info(text):
     print(f"{Colors.CYAN}ℹ️  {text}{Colors.NC}")
 
 
+def get_circleci_session():
+    """Create the shared CircleCI session on first use"""
+    global CIRCLECI_SESSION
+    if CIRCLECI_SESSION is None:
+        import requests
+        from requests.adapters import HTTPAdapter
+        from urllib3.util.retry import Retry
+        
+        CIRCLECI_SESSION = requests.Session()
+        CIRCLECI_SESSION.headers.update({
+            'Circle-Token': CIRCLECI_TOKEN,
+            'Content-Type': 'application/json'
+        })
+        # Retries cover idempotent calls only (urllib3 never retries the
+        # pipeline POST), so a pipeline is never triggered twice
+        CIRCLECI_SESSION.mount('https://', HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=4,
+            max_retries=Retry(total=3, backoff_factor=0.3, status_forcelist=[429, 500, 502, 503, 504])
+        ))
+    return CIRCLECI_SESSION
+
+
 def validate_token():
     """Validate CircleCI token is set"""
     if not CIRCLECI_TOKEN:
@@ -75,8 +155,12 @@ def validate_token():
 
 def validate_date_format(date_str):
     """Validate date is in YYYY-MM-DD format"""
+    match = DATE_PATTERN.fullmatch(date_str)
+    if not match:
+        return False
+    # The pattern allows day 31 in any month; reject dates like 2026-02-30
     try:
-        datetime.strptime(date_str, '%Y-%m-%d')
+        datetime(int(match.group(1)), int(match.group(2)), int(match.group(3)))
         return True
     except ValueError:
         return False
@@ -84,52 +168,44 @@ def validate_date_format(date_str):
 
 def validate_time_format(time_str):
     """Validate time is in HH-MM-JST or HH-MM-JST or HH-MM-UTC format"""
-    if not (time_str.endswith('-JST') or time_str.endswith('-UTC')):
-        return False
-    try:
-        time_part = time_str.replace('-JST', '').replace('-UTC', '')
-        datetime.strptime(time_part, '%H-%M')
-        return True
-    except ValueError:
-        return False
+    return TIME_PATTERN.fullmatch(time_str) is not None
 
 
-def trigger_circleci_pipeline(parameters=None):
+def trigger_circleci_pipeline(config, parameters=None):
     """
     Trigger CircleCI pipeline via API
     
     Args:
+        config (Config): Target repository and branch
         parameters (dict): Pipeline parameters
     
     Returns:
         dict: API response or None if failed
     """
-    url = f"https://circleci.com/api/v2/project/gh/{REPO_OWNER}/{REPO_NAME}/pipeline"
+    import requests
     
-    headers = {
-        "Content-Type": "application/json",
-        "Circle-Token": CIRCLECI_TOKEN
-    }
+    url = f"https://circleci.com/api/v2/project/gh/{config.repo_owner}/{config.repo_name}/pipeline"
     
     payload = {
-        "branch": BRANCH
+        "branch": config.branch
     }
     
     if parameters:
         payload["parameters"] = parameters
     
     try:
-        response = requests.post(url, headers=headers, json=payload, timeout=30)
-        response.raise_for_status()
-        return response.json()
+        with get_circleci_session().post(url, data=json_dumps(payload), timeout=30) as response:
+            response.raise_for_status()
+            return json_loads(response.content)
     except requests.exceptions.HTTPError as e:
         print_error(f"HTTP Error: {e}")
-        if response.text:
+        if response.content:
             try:
-                error_data = json.loads(response.text)
+                error_data = json_loads(response.content)
                 print(f"Error details: {json.dumps(error_data, indent=2)}")
-            except:
-                print(f"Error response: {response.text}")
+            except ValueError:
+                # Cap non-JSON bodies such as HTML error pages
+                print(f"Error response: {response.text[:ERROR_BODY_LIMIT]}")
         return None
     except requests.exceptions.RequestException as e:
         print_error(f"Request failed: {e}")
@@ -146,21 +222,26 @@ def get_pipeline_workflows(pipeline_id):
     Returns:
         list: List of workflows
     """
-    url = f"https://circleci.com/api/v2/pipeline/{pipeline_id}/workflow"
+    import requests
     
-    headers = {
-        "Circle-Token": CIRCLECI_TOKEN
-    }
+    url = f"https://circleci.com/api/v2/pipeline/{pipeline_id}/workflow"
     
+    workflows = []
     try:
-        response = requests.get(url, headers=headers, timeout=30)
-        response.raise_for_status()
-        return response.json().get('items', [])
-    except:
+        for delay in WORKFLOW_POLL_DELAYS:
+            time.sleep(delay)
+            response = get_circleci_session().get(url, timeout=30)
+            response.raise_for_status()
+            workflows = json_loads(response.content).get('items', [])
+            if workflows:
+                break
+    except (requests.exceptions.RequestException, ValueError):
+        # Workflow status is informational only; the pipeline is already running
         return []
+    return workflows
 
 
-def list_backups():
+def list_backups(config):
     """Trigger pipeline to list available backups"""
     print_header("List Available NiFi Backups")
     
@@ -168,7 +249,7 @@ def list_backups():
     print_info("This will show all available backups from GitHub")
     print()
     
-    result = trigger_circleci_pipeline()
+    result = trigger_circleci_pipeline(config)
     
     if result:
         pipeline_id = result.get('id')
@@ -179,17 +260,17 @@ def list_backups():
         print(f"{Colors.BOLD}Pipeline Details:{Colors.NC}")
         print(f"  📊 Number: {pipeline_number}")
         print(f"  🆔 ID: {pipeline_id}")
-        print(f"  🌿 Branch: {BRANCH}")
+        print(f"  🌿 Branch: {config.branch}")
         print()
         
-        pipeline_url = f"https://app.circleci.com/pipelines/github/{REPO_OWNER}/{REPO_NAME}/{pipeline_number}"
+        pipeline_url = f"https://app.circleci.com/pipelines/github/{config.repo_owner}/{config.repo_name}/{pipeline_number}"
         print(f"{Colors.BOLD}View Pipeline:{Colors.NC}")
         print(f"  {Colors.BLUE}{pipeline_url}{Colors.NC}")
         print()
         
-        print(f"{Colors.CYAN}{'─' * 70}{Colors.NC}")
+        print(SECTION_RULE)
         print(f"{Colors.CYAN}Next Steps:{Colors.NC}")
-        print(f"{Colors.CYAN}{'─' * 70}{Colors.NC}")
+        print(SECTION_RULE)
         print("1. Click the pipeline URL above")
         print("2. Wait for 'list-available-backups' job to complete")
         print("3. Click on the job to view logs")
@@ -197,7 +278,7 @@ def list_backups():
         print()
         print("Then run:")
         print(f"  {Colors.YELLOW}python {sys.argv[0]} --date YYYY-MM-DD --time HH-MM-JST or HH-MM-UTC{Colors.NC}")
-        print(f"{Colors.CYAN}{'─' * 70}{Colors.NC}")
+        print(SECTION_RULE)
         print()
         
         return True
@@ -205,14 +286,16 @@ def list_backups():
     return False
 
 
-def rollback_to_backup(backup_date, backup_time, automated=False):
+def rollback_to_backup(config, backup_date, backup_time, automated=False, auto_confirm=False):
     """
     Trigger rollback to specific backup
     
     Args:
+        config (Config): Target repository and branch
         backup_date (str): Backup date in YYYY-MM-DD format
         backup_time (str): Backup time in HH-MM-JST or HH-MM-UTC format
         automated (bool): If True, uploads directly to NiFi
+        auto_confirm (bool): If True, skips the confirmation prompt
     """
     print_header("NiFi Rollback Execution")
     
@@ -245,8 +328,8 @@ def rollback_to_backup(backup_date, backup_time, automated=False):
     print(f"{Colors.MAGENTA}{Colors.BOLD}Rollback Configuration:{Colors.NC}")
     print(f"  📅 Backup Date: {Colors.BOLD}{backup_date}{Colors.NC}")
     print(f"  🕐 Backup Time: {Colors.BOLD}{backup_time}{Colors.NC}")
-    print(f"  🔗 Repository: {REPO_OWNER}/{REPO_NAME}")
-    print(f"  🌿 Branch: {BRANCH}")
+    print(f"  🔗 Repository: {config.repo_owner}/{config.repo_name}")
+    print(f"  🌿 Branch: {config.branch}")
     print(f"  🤖 Automated: {Colors.BOLD}{'YES - Direct upload to NiFi' if automated else 'NO - Manual completion required'}{Colors.NC}")
     print()
     
@@ -280,23 +363,31 @@ def rollback_to_backup(backup_date, backup_time, automated=False):
     print()
     
     # Confirmation
-    try:
-        if automated:
-            confirm = input(f"{Colors.RED}{Colors.BOLD}Type 'AUTOMATED ROLLBACK' to proceed: {Colors.NC}")
-            if confirm != "AUTOMATED ROLLBACK":
-                print()
-                print_warning("Rollback cancelled by user")
-                return False
-        else:
-            confirm = input(f"{Colors.YELLOW}{Colors.BOLD}Are you sure you want to proceed? (yes/no): {Colors.NC}")
-            if confirm.lower() != 'yes':
-                print()
-                print_warning("Rollback cancelled by user")
-                return False
-    except (KeyboardInterrupt, EOFError):
-        print()
-        print_warning("Rollback cancelled by user")
+    if auto_confirm:
+        print_warning("--yes given, skipping confirmation")
+    elif not sys.stdin.isatty():
+        # Nobody can answer the prompt; fail fast instead of waiting on stdin
+        print_error("No terminal available for confirmation")
+        print("Re-run with --yes to confirm non-interactively")
         return False
+    else:
+        try:
+            if automated:
+                confirm = input(f"{Colors.RED}{Colors.BOLD}Type 'AUTOMATED ROLLBACK' to proceed: {Colors.NC}")
+                if confirm != "AUTOMATED ROLLBACK":
+                    print()
+                    print_warning("Rollback cancelled by user")
+                    return False
+            else:
+                confirm = input(f"{Colors.YELLOW}{Colors.BOLD}Are you sure you want to proceed? (yes/no): {Colors.NC}")
+                if confirm.lower() != 'yes':
+                    print()
+                    print_warning("Rollback cancelled by user")
+                    return False
+        except (KeyboardInterrupt, EOFError):
+            print()
+            print_warning("Rollback cancelled by user")
+            return False
     
     print()
     print_info("Triggering CircleCI rollback pipeline...")
@@ -309,7 +400,7 @@ def rollback_to_backup(backup_date, backup_time, automated=False):
         "automated": automated
     }
     
-    result = trigger_circleci_pipeline(parameters)
+    result = trigger_circleci_pipeline(config, parameters)
     
     if result:
         pipeline_id = result.get('id')
@@ -325,15 +416,15 @@ def rollback_to_backup(backup_date, backup_time, automated=False):
         print(f"  🤖 Mode: {'AUTOMATED' if automated else 'MANUAL'}")
         print()
         
-        pipeline_url = f"https://app.circleci.com/pipelines/github/{REPO_OWNER}/{REPO_NAME}/{pipeline_number}"
+        pipeline_url = f"https://app.circleci.com/pipelines/github/{config.repo_owner}/{config.repo_name}/{pipeline_number}"
         print(f"{Colors.BOLD}View Pipeline:{Colors.NC}")
         print(f"  {Colors.BLUE}{pipeline_url}{Colors.NC}")
         print()
         
         if automated:
-            print(f"{Colors.CYAN}{'─' * 70}{Colors.NC}")
+            print(SECTION_RULE)
             print(f"{Colors.CYAN}{Colors.BOLD}AUTOMATED ROLLBACK - Action Required:{Colors.NC}")
-            print(f"{Colors.CYAN}{'─' * 70}{Colors.NC}")
+            print(SECTION_RULE)
             print()
             print(f"{Colors.BOLD}Step 1: Open Pipeline{Colors.NC}")
             print(f"  Click the URL above")
@@ -357,11 +448,11 @@ def rollback_to_backup(backup_date, backup_time, automated=False):
             print(f"  - Start processors manually")
             print(f"  - Monitor for issues")
             print()
-            print(f"{Colors.CYAN}{'─' * 70}{Colors.NC}")
+            print(SECTION_RULE)
         else:
-            print(f"{Colors.CYAN}{'─' * 70}{Colors.NC}")
+            print(SECTION_RULE)
             print(f"{Colors.CYAN}{Colors.BOLD}MANUAL ROLLBACK - Action Required:{Colors.NC}")
-            print(f"{Colors.CYAN}{'─' * 70}{Colors.NC}")
+            print(SECTION_RULE)
             print()
             print(f"{Colors.BOLD}Step 1: Approve in CircleCI{Colors.NC}")
             print(f"  1. Find 'manual-rollback' workflow")
@@ -379,143 +470,10 @@ def rollback_to_backup(backup_date, backup_time, automated=False):
             print(f"  3. Review and apply changes")
             print(f"  4. Start processors")
             print()
-            print(f"{Colors.CYAN}{'─' * 70}{Colors.NC}")
-        
-        print()
-        return True
-    
-    return False
-    """
-    Trigger rollback to specific backup
-    
-    Args:
-        backup_date (str): Backup date in YYYY-MM-DD format
-        backup_time (str): Backup time in HH-MM-JST or HH-MM-UTC format
-    """
-    print_header("NiFi Rollback Execution")
-    
-    # Validate date format
-    if not validate_date_format(backup_date):
-        print_error(f"Invalid date format: {backup_date}")
-        print()
-        print("Expected format: YYYY-MM-DD")
-        print("Examples:")
-        print("  ✅ 2026-01-26")
-        print("  ✅ 2025-12-31")
-        print("  ❌ 26-01-2026 (wrong order)")
-        print("  ❌ 2026/01/26 (wrong separator)")
-        return False
-    
-    # Validate time format
-    if not validate_time_format(backup_time):
-        print_error(f"Invalid time format: {backup_time}")
-        print()
-        print("Expected format: HH-MM-JST or HH-MM-UTC")
-        print("Examples:")
-        print("  ✅ 12-00-JST")
-        print("  ✅ 00-00-UTC")
-        print("  ✅ 23-59-UTC")
-        print("  ❌ 12-00 (missing -UTC)")
-        print("  ❌ 12:00-UTC (wrong separator)")
-        return False
-    
-    # Show rollback details
-    print(f"{Colors.MAGENTA}{Colors.BOLD}Rollback Configuration:{Colors.NC}")
-    print(f"  📅 Backup Date: {Colors.BOLD}{backup_date}{Colors.NC}")
-    print(f"  🕐 Backup Time: {Colors.BOLD}{backup_time}{Colors.NC}")
-    print(f"  🔗 Repository: {REPO_OWNER}/{REPO_NAME}")
-    print(f"  🌿 Branch: {BRANCH}")
-    print()
-    
-    # Warning
-    print_warning("This will initiate a ROLLBACK operation")
-    print()
-    print(f"{Colors.YELLOW}What will happen:{Colors.NC}")
-    print("  1. Pipeline will be triggered with your parameters")
-    print("  2. Parameters will be validated automatically")
-    print("  3. You'll need to APPROVE the rollback in CircleCI UI")
-    print("  4. Backup will be downloaded from GitHub")
-    print("  5. Backup file will be saved to CircleCI artifacts")
-    print("  6. You'll receive instructions to complete the rollback")
-    print()
-    
-    # Confirmation
-    try:
-        confirm = input(f"{Colors.YELLOW}{Colors.BOLD}Are you sure you want to proceed? (yes/no): {Colors.NC}")
-        if confirm.lower() != 'yes':
-            print()
-            print_warning("Rollback cancelled by user")
-            return False
-    except (KeyboardInterrupt, EOFError):
-        print()
-        print_warning("Rollback cancelled by user")
-        return False
-    
-    print()
-    print_info("Triggering CircleCI rollback pipeline...")
-    print()
-    
-    # Trigger with parameters
-    parameters = {
-        "backup-date": backup_date,
-        "backup-time": backup_time
-    }
-    
-    result = trigger_circleci_pipeline(parameters)
-    
-    if result:
-        pipeline_id = result.get('id')
-        pipeline_number = result.get('number')
-        
-        print_success("Rollback pipeline triggered successfully!")
-        print()
-        print(f"{Colors.BOLD}Pipeline Details:{Colors.NC}")
-        print(f"  📊 Number: {pipeline_number}")
-        print(f"  🆔 ID: {pipeline_id}")
-        print(f"  📅 Date: {backup_date}")
-        print(f"  🕐 Time: {backup_time}")
-        print()
-        
-        pipeline_url = f"https://app.circleci.com/pipelines/github/{REPO_OWNER}/{REPO_NAME}/{pipeline_number}"
-        print(f"{Colors.BOLD}View Pipeline:{Colors.NC}")
-        print(f"  {Colors.BLUE}{pipeline_url}{Colors.NC}")
-        print()
-        
-        print(f"{Colors.CYAN}{'─' * 70}{Colors.NC}")
-        print(f"{Colors.CYAN}{Colors.BOLD}IMPORTANT - Action Required:{Colors.NC}")
-        print(f"{Colors.CYAN}{'─' * 70}{Colors.NC}")
-        print()
-        print(f"{Colors.BOLD}Step 1: Open Pipeline{Colors.NC}")
-        print(f"  Click the URL above or go to CircleCI")
-        print()
-        print(f"{Colors.BOLD}Step 2: Wait for Validation{Colors.NC}")
-        print(f"  The 'validate-parameters' job will run automatically")
-        print(f"  ✅ If parameters are valid, it proceeds to approval")
-        print(f"  ❌ If invalid, the pipeline stops with error message")
-        print()
-        print(f"{Colors.BOLD}Step 3: Approve the Rollback{Colors.NC}")
-        print(f"  1. Find the 'execute-rollback' workflow")
-        print(f"  2. Click on 'hold-for-rollback-approval' job")
-        print(f"  3. Review the rollback details carefully")
-        print(f"  4. Click the {Colors.GREEN}[Approve]{Colors.NC} button")
-        print()
-        print(f"{Colors.BOLD}Step 4: Monitor Execution{Colors.NC}")
-        print(f"  1. Watch the 'nifi-rollback' job logs")
-        print(f"  2. Backup will be downloaded from GitHub")
-        print(f"  3. Go to 'Artifacts' tab when job completes")
-        print(f"  4. Download the backup file")
-        print()
-        print(f"{Colors.BOLD}Step 5: Complete in NiFi UI{Colors.NC}")
-        print(f"  Follow the instructions in the job logs to:")
-        print(f"  - Stop processors in NiFi")
-        print(f"  - Upload the backup file")
-        print(f"  - Apply changes")
-        print(f"  - Restart processors")
-        print()
-        print(f"{Colors.CYAN}{'─' * 70}{Colors.NC}")
-        print()
+            print(SECTION_RULE)
         
         # Try to get workflow info
+        print()
         print_info("Fetching workflow information...")
         workflows = get_pipeline_workflows(pipeline_id)
         if workflows:
@@ -524,18 +482,10 @@ def rollback_to_backup(backup_date, backup_time, automated=False):
             for workflow in workflows:
                 name = workflow.get('name', 'Unknown')
                 status = workflow.get('status', 'unknown')
-                workflow_id = workflow.get('id', '')
-                
-                status_icon = {
-                    'running': '🔄',
-                    'success': '✅',
-                    'failed': '❌',
-                    'on_hold': '⏸️',
-                    'canceled': '⛔',
-                    'not_run': '⏭️'
-                }.get(status, '❓')
-                
+                status_icon = WORKFLOW_STATUS_ICONS.get(status, '❓')
                 print(f"  {status_icon} {name}: {status}")
+        else:
+            print_warning("Workflows not created yet; check the pipeline URL above")
         
         print()
         return True
@@ -556,6 +506,9 @@ Examples:
   # Rollback to specific backup
   python trigger_rollback_circleci.py --date 2026-01-26 --time 12-00-JST
   
+  # Rollback without the confirmation prompt (e.g. from CI)
+  python trigger_rollback_circleci.py --date 2026-01-26 --time 12-00-JST --yes
+  
   # Using custom repository
   export REPO_OWNER="myorg"
   export REPO_NAME="my-nifi-repo"
@@ -595,6 +548,12 @@ Environment Variables:
         help='Automated rollback (uploads directly to NiFi - DANGEROUS!)'
     )
     
+    parser.add_argument(
+        '--yes', '-y',
+        action='store_true',
+        help='Skip the confirmation prompt (for non-interactive use)'
+    )
+    
     parser.add_argument(
         '--repo-owner',
         type=str,
@@ -615,14 +574,12 @@ Environment Variables:
     
     args = parser.parse_args()
     
-    # Override globals if provided
-    global REPO_OWNER, REPO_NAME, BRANCH
-    if args.repo_owner:
-        REPO_OWNER = args.repo_owner
-    if args.repo_name:
-        REPO_NAME = args.repo_name
-    if args.branch:
-        BRANCH = args.branch
+    # Command-line values override the environment defaults
+    config = Config(
+        repo_owner=args.repo_owner or REPO_OWNER,
+        repo_name=args.repo_name or REPO_NAME,
+        branch=args.branch or BRANCH
+    )
     
     # Validate token
     if not validate_token():
@@ -632,9 +589,9 @@ Environment Variables:
     success = False
     
     if args.list:
-        success = list_backups()
+        success = list_backups(config)
     elif args.date and args.time:
-        success = rollback_to_backup(args.date, args.time, args.automated)
+        success = rollback_to_backup(config, args.date, args.time, args.automated, args.yes)
     elif args.date or args.time:
         print_error("Both --date and --time are required for rollback")
         print()
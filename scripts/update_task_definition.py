@@ -6,65 +6,148 @@ Creates a PR with the updated task definition.
 
 import os
 import re
+import base64
 from datetime import datetime
-from github import Github, Auth
+from functools import lru_cache
+from urllib3.util.retry import Retry
 
 
-def update_task_definition_content(task_def_path: str, image_tag: str, aws_account_id: str, aws_region: str) -> str:
+# Bounded retries on transient gateway errors instead of PyGithub's default
+# of up to 10 attempts
+GITHUB_RETRY = Retry(total=3, backoff_factor=0.5, status_forcelist=[502, 503, 504])
+
+# Same policy for the GraphQL commit, with POST allowed: expectedHeadOid makes
+# a repeated createCommitOnBranch fail instead of committing twice
+GITHUB_GRAPHQL_RETRY = GITHUB_RETRY.new(allowed_methods=None)
+
+GITHUB_GRAPHQL_URL = os.environ.get('GITHUB_GRAPHQL_URL', 'https://api.github.com/graphql')
+
+# Creates or updates files on a branch in one call, without first looking
+# up each file's blob SHA
+CREATE_COMMIT_MUTATION = """
+mutation($input: CreateCommitOnBranchInput!) {
+  createCommitOnBranch(input: $input) {
+    commit { oid }
+  }
+}
+"""
+
+# Pattern to match the image line in task definition
+# Looking for: "image" : "ACCOUNT.dkr.ecr.REGION.amazonaws.com/REPO:TAG"
+IMAGE_LINE_REGEX = (
+    r'("image"\s*:\s*"\d+\.dkr\.ecr\.[^"]+\.amazonaws\.com/apache-nifi-with-custom-jars-repo):[^"]+"'
+)
+ECR_IMAGE_PATTERN = re.compile(IMAGE_LINE_REGEX)
+
+# Current tag of the first image in the task definition
+IMAGE_TAG_PATTERN = re.compile(r'"image"\s*:\s*"[^"]+:([^"]+)"')
+
+
+@lru_cache(maxsize=8)
+def ecr_image_pattern(aws_account_id: str, aws_region: str) -> re.Pattern:
     """
-    Update the ECS task definition with the new image tag.
+    Compile one pattern matching both image lines and explicit image
+    references in one account/region, so the content is scanned once.
     """
-    with open(task_def_path, 'r') as f:
-        content = f.read()
-    
-    # Pattern to match the image line in task definition
-    # Looking for: "image" : "ACCOUNT.dkr.ecr.REGION.amazonaws.com/REPO:TAG"
-    ecr_pattern = r'("image"\s*:\s*")(\d+\.dkr\.ecr\.[^"]+\.amazonaws\.com/apache-nifi-with-custom-jars-repo):([^"]+)(")'
+    return re.compile(
+        IMAGE_LINE_REGEX +
+        rf'|({re.escape(aws_account_id)}\.dkr\.ecr\.{re.escape(aws_region)}\.amazonaws\.com/apache-nifi-with-custom-jars-repo):[\w.-]+'
+    )
+
+
+def update_task_definition_content(content: str, image_tag: str, aws_account_id: str, aws_region: str) -> str:
+    """
+    Update the ECS task definition content with the new image tag.
+    """
+    # Explicit image references can only be matched with a known account
+    if aws_account_id:
+        pattern = ecr_image_pattern(aws_account_id, aws_region)
+    else:
+        pattern = ECR_IMAGE_PATTERN
     
     def replace_image(match):
-        prefix = match.group(1)
-        ecr_url = match.group(2)
-        suffix = match.group(4)
-        return f'{prefix}{ecr_url}:{image_tag}{suffix}'
-    
-    updated_content = re.sub(ecr_pattern, replace_image, content)
-    
-    # Also update any explicit image references
-    simple_pattern = rf'({aws_account_id}\.dkr\.ecr\.{aws_region}\.amazonaws\.com/apache-nifi-with-custom-jars-repo):[\w.-]+'
-    updated_content = re.sub(
-        simple_pattern,
-        rf'\1:{image_tag}',
-        updated_content
-    )
+        image_line = match.group(1)
+        if image_line is not None:
+            return f'{image_line}:{image_tag}"'
+        return f'{match.group(2)}:{image_tag}'
     
-    return updated_content
+    return pattern.sub(replace_image, content)
 
 
-def get_current_image_tag(task_def_path: str) -> str:
+def get_current_image_tag(content: str) -> str:
     """
-    Extract the current image tag from the task definition.
+    Extract the current image tag from the task definition content.
     """
-    with open(task_def_path, 'r') as f:
-        content = f.read()
-    
-    pattern = r'"image"\s*:\s*"[^"]+:([^"]+)"'
-    match = re.search(pattern, content)
+    match = IMAGE_TAG_PATTERN.search(content)
     
     if match:
         return match.group(1)
     return "unknown"
 
 
+def commit_files_to_branch(
+    github_token: str,
+    repo_full_name: str,
+    branch_name: str,
+    head_sha: str,
+    files: dict,
+    message: str
+) -> str:
+    """
+    Commit files (path -> content, created or replaced) on top of head_sha
+    as a single commit. Returns the new commit SHA.
+    """
+    import requests
+    from requests.adapters import HTTPAdapter
+    
+    variables = {
+        'input': {
+            'branch': {
+                'repositoryNameWithOwner': repo_full_name,
+                'branchName': branch_name
+            },
+            'message': {'headline': message},
+            'expectedHeadOid': head_sha,
+            'fileChanges': {
+                'additions': [
+                    {
+                        'path': file_path,
+                        'contents': base64.b64encode(content.encode('utf-8')).decode('ascii')
+                    }
+                    for file_path, content in files.items()
+                ]
+            }
+        }
+    }
+    with requests.Session() as session:
+        session.mount('https://', HTTPAdapter(max_retries=GITHUB_GRAPHQL_RETRY))
+        response = session.post(
+            GITHUB_GRAPHQL_URL,
+            json={'query': CREATE_COMMIT_MUTATION, 'variables': variables},
+            headers={'Authorization': f'bearer {github_token}'},
+            timeout=60
+        )
+    response.raise_for_status()
+    result = response.json()
+    if result.get('errors'):
+        raise Exception(f"createCommitOnBranch failed: {result['errors']}")
+    return result['data']['createCommitOnBranch']['commit']['oid']
+
+
 def create_github_pr(
-    updated_content: str,
-    task_def_path: str,
+    updated_files: dict,
     image_tag: str,
     old_tag: str,
     target_branch: str
 ):
     """
     Create a GitHub PR with the task definition changes.
+    updated_files maps each task definition path to its new content.
     """
+    # Only imported when a PR is actually needed; runs where the tag is
+    # already up to date skip loading PyGithub entirely
+    from github import Github, Auth, GithubException
+    
     github_token = os.environ.get('GITHUB_TOKEN')
     repo_name = os.environ.get('CIRCLE_PROJECT_REPONAME')
     repo_owner = os.environ.get('CIRCLE_PROJECT_USERNAME')
@@ -83,14 +166,21 @@ def create_github_pr(
 
     # Use new Auth.Token() method to avoid deprecation warning
     auth = Auth.Token(github_token)
-    g = Github(auth=auth)
+    # One client for the whole run: PyGithub keeps its connection to the API
+    # alive between the base ref, create ref, PR and label calls. The
+    # GraphQL commit in commit_files_to_branch is posted outside this client,
+    # with the same bounded retry policy (GITHUB_GRAPHQL_RETRY).
+    g = Github(auth=auth, retry=GITHUB_RETRY, lazy=True)
 
     # Try to get the repo with better error handling
     repo_full_name = f"{repo_owner}/{repo_name}"
     print(f"Attempting to access repository: {repo_full_name}")
 
+    # The client is lazy: reading the base branch ref is the first call and
+    # doubles as the access check, saving a separate get_repo round trip
+    repo = g.get_repo(repo_full_name)
     try:
-        repo = g.get_repo(repo_full_name)
+        base_sha = repo.get_git_ref(f"heads/{target_branch}").object.sha
         print(f"Successfully accessed repository: {repo_full_name}")
     except Exception as e:
         print(f"ERROR: Failed to access repository '{repo_full_name}'")
@@ -99,6 +189,7 @@ def create_github_pr(
         print("1. Repository name is incorrect")
         print("2. GitHub token doesn't have access to this repository")
         print("3. GitHub token needs 'repo' scope")
+        print(f"4. Target branch '{target_branch}' doesn't exist")
         print(f"\nVerify the repository exists: https://github.com/{repo_full_name}")
         raise
     
@@ -106,28 +197,21 @@ def create_github_pr(
     timestamp = datetime.now().strftime("%Y%m%d-%H%M%S")
     branch_name = f"auto/update-task-def-{image_tag}"
     
-    # Get the base branch
-    base_branch = repo.get_branch(target_branch)
-    base_sha = base_branch.commit.sha
-    
     # Create new branch
     repo.create_git_ref(
         ref=f"refs/heads/{branch_name}",
         sha=base_sha
     )
     
-    # Get current file SHA
-    current_file = repo.get_contents(task_def_path, ref=target_branch)
-    
-    # Update file in new branch
+    # Commit all task definitions to the new branch in one commit
     commit_message = f"Update NiFi image to {image_tag} [skip ci]"
-    
-    repo.update_file(
-        path=task_def_path,
-        message=commit_message,
-        content=updated_content,
-        sha=current_file.sha,
-        branch=branch_name
+    commit_files_to_branch(
+        github_token,
+        repo_full_name,
+        branch_name,
+        base_sha,
+        updated_files,
+        commit_message
     )
     
     # Create PR
@@ -163,11 +247,12 @@ If issues occur, revert this PR or update the image tag to the previous version:
         base=target_branch
     )
     
-    # Add labels
+    # Add labels (a single POST carrying all three)
     try:
         pr.add_to_labels("automated", "infrastructure", "ecs")
-    except Exception:
-        pass
+    except GithubException as e:
+        # The PR already exists; a labelling failure shouldn't fail the job
+        print(f"WARNING: Could not add labels: {e.status} {e.data}")
     
     print(f"Created PR #{pr.number}: {pr.html_url}")
     return pr
@@ -176,47 +261,63 @@ If issues occur, revert this PR or update the image tag to the previous version:
 def main():
     # Get configuration from environment
     task_def_path = os.environ.get('TASK_DEF_PATH', 'workload/mfx-aggre-data-platform/ecs_task_definition.tf')
+    # Colon-separated list for rollouts touching several services
+    task_def_paths = os.environ.get('TASK_DEF_PATHS', task_def_path).split(':')
     target_branch = os.environ.get('TARGET_BRANCH', 'main')
     aws_account_id = os.environ.get('AWS_ACCOUNT_ID')
     aws_region = os.environ.get('AWS_REGION', 'ap-northeast-1')
     
     # Read image tag from workspace
     image_tag_file = '/tmp/image-tag.txt'
-    if os.path.exists(image_tag_file):
+    try:
         with open(image_tag_file, 'r') as f:
             image_tag = f.read().strip()
-    else:
-        # Fallback to environment variable
-        image_tag = os.environ.get('IMAGE_TAG', os.environ.get('CIRCLE_SHA1', '')[:7])
+    except FileNotFoundError:
+        # Fallback to environment variable; an empty IMAGE_TAG also falls
+        # through to the commit SHA
+        image_tag = os.environ.get('IMAGE_TAG') or os.environ.get('CIRCLE_SHA1', '')[:7]
     
     if not image_tag:
         raise ValueError("No image tag provided")
     
-    print(f"Updating task definition: {task_def_path}")
     print(f"New image tag: {image_tag}")
     
-    # Get current tag for comparison
-    old_tag = get_current_image_tag(task_def_path)
-    print(f"Current image tag: {old_tag}")
+    updated_files = {}
+    old_tags = []
+    for path in task_def_paths:
+        print(f"Updating task definition: {path}")
+        
+        # Read the task definition once for both the tag lookup and the update
+        with open(path, 'r') as f:
+            content = f.read()
+        
+        # Get current tag for comparison
+        old_tag = get_current_image_tag(content)
+        print(f"Current image tag: {old_tag}")
+        
+        if old_tag == image_tag:
+            print("Image tag is already up to date.")
+            continue
+        
+        # Update task definition content
+        updated_files[path] = update_task_definition_content(
+            content=content,
+            image_tag=image_tag,
+            aws_account_id=aws_account_id,
+            aws_region=aws_region
+        )
+        if old_tag not in old_tags:
+            old_tags.append(old_tag)
     
-    if old_tag == image_tag:
-        print("Image tag is already up to date. Skipping PR creation.")
+    if not updated_files:
+        print("All task definitions are up to date. Skipping PR creation.")
         return
     
-    # Update task definition content
-    updated_content = update_task_definition_content(
-        task_def_path=task_def_path,
-        image_tag=image_tag,
-        aws_account_id=aws_account_id,
-        aws_region=aws_region
-    )
-    
-    # Create GitHub PR
+    # Create one GitHub PR covering every updated file
     pr = create_github_pr(
-        updated_content=updated_content,
-        task_def_path=task_def_path,
+        updated_files=updated_files,
         image_tag=image_tag,
-        old_tag=old_tag,
+        old_tag=', '.join(old_tags),
         target_branch=target_branch
     )
     
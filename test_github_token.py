@@ -2,13 +2,20 @@
 """
 Test script to verify GitHub token and repository access
 """
+import os
+from concurrent.futures import ThreadPoolExecutor
 from github import Github, Auth
+from urllib3.util.retry import Retry
 
 # Replace with your token
 GITHUB_TOKEN = os.environ.get('GITHUB_TOKEN')
 REPO_OWNER = "medalizaidi"
 REPO_NAME = "nifi-jar-automation-option2"
 
+# Bounded retries on transient gateway errors instead of PyGithub's default
+# of up to 10 attempts
+GITHUB_RETRY = Retry(total=3, backoff_factor=0.5, status_forcelist=[502, 503, 504])
+
 print("Testing GitHub Token...")
 print("=" * 50)
 
@@ -16,20 +23,29 @@ try:
     # Test 1: Authenticate
     print("\n1. Testing authentication...")
     auth = Auth.Token(GITHUB_TOKEN)
-    g = Github(auth=auth)
+    g = Github(auth=auth, retry=GITHUB_RETRY, pool_size=3)
+    repo_full_name = f"{REPO_OWNER}/{REPO_NAME}"
 
-    user = g.get_user()
+    # The user, repository and branch lookups don't depend on each other,
+    # so they are fetched concurrently; results are still reported in order
+    executor = ThreadPoolExecutor(max_workers=3)
+    user_future = executor.submit(lambda: g.get_user().complete())
+    repo_future = executor.submit(g.get_repo, repo_full_name)
+    branches_future = executor.submit(
+        lambda: list(g.withLazy(True).get_repo(repo_full_name).get_branches()[:5])
+    )
+    executor.shutdown(wait=False)
+
+    user = user_future.result()
     print(f"   ✅ Authenticated as: {user.login}")
     print(f"   Name: {user.name}")
     print(f"   Email: {user.email}")
 
     # Test 2: Check token scopes
     print("\n2. Checking token scopes...")
-    # This is a workaround to check scopes
-    import requests
-    headers = {"Authorization": f"token {GITHUB_TOKEN}"}
-    response = requests.get("https://api.github.com/user", headers=headers)
-    scopes = response.headers.get('X-OAuth-Scopes', 'Unknown')
+    # Scopes come back on the /user response already fetched above, so
+    # they are read from it instead of requesting /user a second time
+    scopes = user.raw_headers.get('x-oauth-scopes', 'Unknown')
     print(f"   Token scopes: {scopes}")
 
     if 'repo' in scopes:
@@ -39,10 +55,9 @@ try:
 
     # Test 3: Access repository
     print(f"\n3. Testing repository access...")
-    repo_full_name = f"{REPO_OWNER}/{REPO_NAME}"
     print(f"   Attempting to access: {repo_full_name}")
 
-    repo = g.get_repo(repo_full_name)
+    repo = repo_future.result()
     print(f"   ✅ Successfully accessed: {repo.full_name}")
     print(f"   Description: {repo.description}")
     print(f"   Private: {repo.private}")
@@ -62,7 +77,7 @@ try:
 
     # Test 5: List recent branches
     print(f"\n5. Testing branch access...")
-    branches = list(repo.get_branches())[:5]
+    branches = branches_future.result()
     print(f"   Found {len(branches)} branches:")
     for branch in branches:
         print(f"   - {branch.name}")